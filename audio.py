@@ -0,0 +1,35 @@
+import io
+import wave
+
+# ---------------------------------------------------------
+# 🔊 הרכבת קבצי WAV בזיכרון
+# ---------------------------------------------------------
+# כל השמע בבוט נשמר כ-PCM גולמי בפורמט של ימות:
+# 8 קילוהרץ, מונו, 16 ביט. פתיח, גוף ומדיה מחוברים בזיכרון
+# לקובץ WAV אחד שנשלח ישירות להעלאה, בלי קבצי ביניים ובלי ffmpeg.
+
+SAMPLE_RATE = 8000
+SAMPLE_WIDTH = 2
+CHANNELS = 1
+
+
+def wav_to_pcm(data):
+    """מחלץ PCM גולמי מקובץ WAV (כמו זה שמחזיר Google ב-LINEAR16)"""
+    with wave.open(io.BytesIO(data), "rb") as w:
+        params = (w.getframerate(), w.getsampwidth(), w.getnchannels())
+        if params != (SAMPLE_RATE, SAMPLE_WIDTH, CHANNELS):
+            raise ValueError(f"פורמט WAV לא נתמך: {params}")
+        return w.readframes(w.getnframes())
+
+
+def build_wav(pcm_parts):
+    """מחבר קטעי PCM לפי הסדר לקובץ WAV אחד בזיכרון"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as w:
+        w.setnchannels(CHANNELS)
+        w.setsampwidth(SAMPLE_WIDTH)
+        w.setframerate(SAMPLE_RATE)
+        for pcm in pcm_parts:
+            if pcm:
+                w.writeframesraw(pcm)
+    return buffer.getvalue()
@@ -0,0 +1,202 @@
+import logging
+from collections import deque
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from audio import SAMPLE_RATE
+
+# ---------------------------------------------------------
+# 🎼 זיהוי הקלטות ווידאו כפולים לפי טביעת שמע
+# ---------------------------------------------------------
+# הבדיקה הזולה היא file_unique_id של טלגרם (אותו קובץ בדיוק). עותק
+# שקודד מחדש מקבל מזהה אחר, ולכן מחושבת גם טביעה ספקטרלית מה-PCM
+# (8kHz מונו): האנרגיה ב-16 פסי תדר לכל פריים של 64ms (כל 32ms, חפיפה
+# של חצי), וביט לכל זוג פסים סמוכים - האם ההפרש ביניהם עלה או ירד
+# מהפריים הקודם. הטביעה עמידה לשינויי עוצמה ולקידוד מחדש, ותופסת שני
+# בתים לפריים. הדמיון הוא אחוז הביטים הזהים, בהיסט הטוב ביותר של כמה
+# פריימים: קטעים שונים יוצאים סביב 0.5 בדיוק, ועותקים מקודדים מחדש
+# סביב 0.65-0.75.
+#
+# הטביעות של החלון שמורות במטריצה אחת (שורה לכל קטע), כך שהחיפוש הוא
+# כמה פעולות NumPy על כל החלון יחד ולא לולאה בפייתון. החישוב והחיפוש
+# לא משנים את האינדקס (match), ולכן רצים בת'רד מחוץ ללולאת האירועים.
+
+FRAME = 512                      # 64ms ב-8kHz
+HOP = 256                        # פריים חדש כל 32ms
+BANDS = 16
+MAX_SECONDS = 60                 # מספיק כדי לזהות, ושומר על טביעה קטנה
+MAX_SHIFT = 6                    # היסט מקסימלי בין עותקים (בפריימים)
+MIN_FRAMES = 30                  # פחות משנייה - אין מספיק מידע להשוואה
+MAX_FRAMES = (MAX_SECONDS * SAMPLE_RATE - FRAME) // HOP   # אורך הטביעה המקסימלי
+
+# גבולות הפסים בסקאלה לוגריתמית בין 250 ל-3500 הרץ
+_EDGES = np.geomspace(250, 3500, BANDS + 1)
+_BINS = np.fft.rfftfreq(FRAME, 1 / SAMPLE_RATE)
+_BAND_OF_BIN = np.searchsorted(_EDGES, _BINS) - 1
+_WINDOW = np.hanning(FRAME).astype(np.float32)
+# מטריצה שמסכמת את תאי ה-FFT לפסים (כפל מטריצות במקום לולאה על הפסים)
+_BAND_MATRIX = (_BAND_OF_BIN[:, None] == np.arange(BANDS)[None, :]).astype(np.float32)
+_POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(1 << 16)], dtype=np.uint8)
+
+
+def _popcount(values):
+    # NumPy 2 סופר ביטים בפקודה אחת; בגרסאות ישנות - טבלה
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values)
+    return _POPCOUNT_TABLE[values]
+
+
+def fingerprint(pcm):
+    """מחזיר מערך uint16 (ביטים לכל פריים), או None אם ההקלטה קצרה מדי"""
+    samples = np.frombuffer(pcm, dtype="<i2", count=min(len(pcm) // 2, MAX_SECONDS * SAMPLE_RATE))
+    if len(samples) < FRAME + MIN_FRAMES * HOP:
+        return None
+    frames = sliding_window_view(samples, FRAME)[::HOP]
+    spectrum = np.abs(np.fft.rfft(frames * _WINDOW, axis=1)) ** 2
+    energy = np.log1p(spectrum.astype(np.float32) @ _BAND_MATRIX)
+    # הפרש בין פסים סמוכים, ואז השינוי שלו בזמן
+    diff = energy[:, :-1] - energy[:, 1:]
+    bits = (diff[1:] - diff[:-1]) > 0
+    weights = (1 << np.arange(BANDS - 1)).astype(np.uint16)
+    fp = (bits.astype(np.uint16) * weights).sum(axis=1).astype(np.uint16)
+    # שקט דיגיטלי נותן פריימים ריקים, ושתי הקלטות שקטות היו נראות זהות
+    if np.count_nonzero(fp) < MIN_FRAMES:
+        return None
+    return fp
+
+
+def similarity(fp_a, fp_b, max_shift=MAX_SHIFT):
+    """אחוז הביטים הזהים בחפיפה, בהיסט הטוב ביותר (0 עד 1)"""
+    best = 0.0
+    for shift in range(-max_shift, max_shift + 1):
+        a = fp_a[max(0, shift):]
+        b = fp_b[max(0, -shift):]
+        n = min(len(a), len(b))
+        if n < MIN_FRAMES:
+            continue
+        errors = int(_popcount(a[:n] ^ b[:n]).sum())
+        best = max(best, 1 - errors / (n * (BANDS - 1)))
+    return best
+
+
+class MediaDuplicateIndex:
+    def __init__(self, threshold=0.6, window=300, store=None, chat_id=None):
+        self.threshold = threshold
+        self.window = window
+        self.store = store
+        self.chat_id = chat_id
+        self._items = deque()        # file_unique_id מהישן לחדש
+        self._file_ids = {}          # file_unique_id -> מספר הופעות בחלון
+        # טבעת של טביעות: קטע מספר k נשמר בשורה k % window (אפסים אחרי סופו),
+        # ואורך 0 מסמן קטע בלי טביעה
+        self._matrix = np.zeros((window, MAX_FRAMES), dtype=np.uint16)
+        self._lengths = np.zeros(window, dtype=np.int64)
+        self._added = 0
+        self._appended = 0
+        self._last_row = 0           # השורה האחרונה במאגר שכבר נטענה
+        if store is not None:
+            self._load()
+
+    def __len__(self):
+        return len(self._items)
+
+    def seen_file(self, file_unique_id):
+        """בדיקה זולה, לפני ההורדה: בדיוק אותו קובץ כבר עלה בערוץ"""
+        return bool(file_unique_id) and file_unique_id in self._file_ids
+
+    def find(self, fp):
+        """מחזיר את הדמיון הגבוה ביותר מעל הסף, או None.
+        זהה ל-similarity מול כל קטע בחלון, על כל הקטעים יחד."""
+        fp = fp[:MAX_FRAMES]
+        lengths = self._lengths
+        # עותק של אותו קטע באורך דומה; מסננים לפי אורך לפני ההשוואה המלאה
+        rows = np.flatnonzero((lengths > 0) & (np.abs(lengths - len(fp)) <= max(MAX_SHIFT, 0.1 * len(fp))))
+        if not len(rows):
+            return None
+        # העתקה של השורות הרלוונטיות, כך שהוספה במקביל לא משנה אותן באמצע
+        matrix = self._matrix[rows]
+        lengths = lengths[rows]
+        best = np.zeros(len(rows))
+        for shift in range(-MAX_SHIFT, MAX_SHIFT + 1):
+            a = fp[max(0, shift):]
+            b = matrix[:, max(0, -shift):]
+            width = min(len(a), b.shape[1])
+            n = np.minimum(len(a), lengths - max(0, -shift))
+            # אחרי סוף הקטע השורה מכילה אפסים, ושם ה-XOR הוא הביטים של a עצמו;
+            # מחסרים אותם בעזרת סכום מצטבר של הביטים ב-a
+            ones = np.concatenate(([0], np.cumsum(_popcount(a[:width]), dtype=np.int64)))
+            errors = _popcount(a[:width] ^ b[:, :width]).sum(axis=1, dtype=np.uint32).astype(np.int64)
+            errors -= ones[width] - ones[np.clip(n, 0, width)]
+            valid = n >= MIN_FRAMES
+            scores = 1 - errors / (np.maximum(n, 1) * (BANDS - 1))
+            best = np.maximum(best, np.where(valid, scores, 0.0))
+        top = float(best.max())
+        return top if top >= self.threshold else None
+
+    def match(self, pcm):
+        """מחשב טביעה ומחפש אותה בחלון, בלי לשנות את האינדקס (בטוח לת'רד).
+        מחזיר (טביעה, דמיון מעל הסף או None)."""
+        fp = fingerprint(pcm)
+        if fp is None:
+            return None, None
+        return fp, self.find(fp)
+
+    def record(self, file_unique_id, fp, score):
+        """רושם את תוצאת match. מחזיר (כפול?, דמיון)"""
+        if score is not None:
+            # גם המזהה של העותק נרשם, כדי שהעותק הבא ייתפס עוד לפני ההורדה
+            self.add(file_unique_id, None)
+            return True, score
+        self.add(file_unique_id, fp)
+        return False, 0.0
+
+    def check_and_add(self, file_unique_id, pcm):
+        """בודק אם השמע כפול; אם לא - מוסיף אותו. מחזיר (כפול?, דמיון)"""
+        return self.record(file_unique_id, *self.match(pcm))
+
+    def add(self, file_unique_id, fp, persist=True):
+        self._items.append(file_unique_id)
+        self._file_ids[file_unique_id] = self._file_ids.get(file_unique_id, 0) + 1
+        row = self._added % self.window
+        self._added += 1
+        self._matrix[row] = 0
+        if fp is None:
+            self._lengths[row] = 0
+        else:
+            fp = fp[:MAX_FRAMES]
+            self._matrix[row, :len(fp)] = fp
+            self._lengths[row] = len(fp)
+        while len(self._items) > self.window:
+            old_id = self._items.popleft()
+            self._file_ids[old_id] -= 1
+            if not self._file_ids[old_id]:
+                del self._file_ids[old_id]
+        if persist and self.store is not None:
+            self._persist(file_unique_id, fp)
+
+    # --- שמירה במאגר המצב ---
+    def _load(self):
+        self.refresh()
+
+    def refresh(self):
+        """טוען קטעים שנוספו למאגר מאז הטעינה האחרונה (ע"י תהליך אחר)"""
+        if self.store is None:
+            return
+        for row_id, file_unique_id, blob in self.store.load_media_history(self.chat_id, self.window,
+                                                                          after=self._last_row):
+            self._last_row = row_id
+            fp = np.frombuffer(blob, dtype="<u2").astype(np.uint16) if blob else None
+            self.add(file_unique_id, fp, persist=False)
+
+    def _persist(self, file_unique_id, fp):
+        try:
+            blob = fp.astype("<u2").tobytes() if fp is not None else None
+            row_id = self.store.append_media_history(self.chat_id, file_unique_id, blob)
+            self._last_row = max(self._last_row, row_id)
+            self._appended += 1
+            if self._appended >= self.window:
+                self.store.trim_media_history(self.chat_id, self.window)
+                self._appended = 0
+        except Exception as e:
+            logging.error(f"❌ שגיאה בשמירת היסטוריית מדיה: {e}")
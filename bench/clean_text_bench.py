@@ -0,0 +1,131 @@
+"""השוואת ביצועים ותוצאות בין מנוע הניקוי המוכן מראש לבין clean_text המקורי.
+
+הרצה מתיקיית הפרויקט:
+    python bench/clean_text_bench.py [--rounds 2000] [--check]
+
+עם --check הסקריפט נכשל אם יש הבדל בתוצאה מול הגרסה המקורית.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from text_cleaner import TextCleaner  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load(name):
+    with open(os.path.join(ROOT, name), encoding="utf-8") as f:
+        return json.load(f)
+
+
+# ---------------------------------------------------------
+# 🐢 הגרסה המקורית (קריאת קבצים בכל הודעה ומעברים נפרדים)
+# ---------------------------------------------------------
+def legacy_clean_text(text):
+    if not text: return ""
+    replacements = load("replacements.json")
+    for src in sorted(replacements.keys(), key=len, reverse=True):
+        text = text.replace(src, replacements[src])
+    blocked_words = load("blacklist.json")
+    for word in blocked_words:
+        text = text.replace(word, '')
+    text = re.sub(r'https?://\S+', '', text)
+    text = re.sub(r'www\.\S+', '', text)
+    text = re.sub(r'chat\.whatsapp\.com\S*', '', text)
+    text = re.sub(r'wa\.me\S*', '', text)
+    text = re.sub(r't\.me\S*', '', text)
+    text = re.sub(r'[a-zA-Z0-9-]+\.(com|co\.il|net|org|me)\S*', '', text)
+    text = re.sub(r'@\S+', '', text)
+    text = re.sub(r'\d{2,3}[-\s]?\d{3}[-\s]?\d{4}', '', text)
+    text = re.sub(r'[^\w\s.,!?()\u0590-\u05FF]', '', text)
+    text = re.sub(r'\s+', ' ', text).strip()
+    return text
+
+
+# ---------------------------------------------------------
+# 📰 יצירת הודעות מציאותיות
+# ---------------------------------------------------------
+BODIES = [
+    "דרמה בכנסת: רה\"מ נפגש הערב עם יו\"ר האופוזיציה לשיחה דחופה על חוק הגיוס.",
+    "🔴 התרעה: אזעקות נשמעו בשעה 21:30 באזור הדרום, אין דיווח על נפגעים.",
+    "ביהמ\"ש העליון דחה את העתירה נגד החלטת הממשלה, פסק הדין יפורסם במוצ\"ש.",
+    "ח\"כ מהאופוזיציה תקף את שר האוצר: \"התקציב הזה פוגע במשפחות ברוכות ילדים\".",
+    "אסון בצפון: צעיר בן 24 נהרג בתאונת דרכים קשה בכביש 90, הלווייתו תצא היום בשעה 16:00 מביהכ\"נ הגדול.",
+    "בעז\"ה ההכנסת ס\"ת תתקיים בערב ש\"ק בביהמ\"ד המרכזי, הציבור מוזמן.",
+    "נשיא ארה\"ב הודיע על סבב שיחות חדש במזרח התיכון, במשרד רה\"מ מסרבים להגיב.",
+    "מזג האוויר: גשמים עזים צפויים בחוהמ\"ס, הזהרה מפני שיטפונות בנחלים.",
+    "הקב\"ה ישלח רפואה שלמה לבחור שנפצע הבוקר, הבה\"ח שוהה בביה\"ח במצב בינוני.",
+    "רה\"י הגיע לחו\"ל לכנס תורני, ישוב אי\"ה לקראת ר\"ח.",
+]
+
+FOOTERS = [
+    "לעדכוני הפרגוד בטלגרם https://t.me/hapargod",
+    "חדשות המוקד • בטלגרם: t.me/hamoked_il",
+    "בוואטסאפ: https://chat.whatsapp.com/LoxVwdYOKOAH2y2kaO8GQ7",
+    "לשליחת חומרים: 052-763-7624 | דיסקרטיות מובטחת",
+    "צילום: דוברות המשטרה",
+    "@N12chat",
+    "להצטרפות לידיעות בני ברק www.bbnews.co.il/join",
+    "",
+]
+
+
+def make_posts(count, seed=7):
+    rnd = random.Random(seed)
+    posts = []
+    for _ in range(count):
+        body = " ".join(rnd.sample(BODIES, rnd.randint(1, 4)))
+        footer = "\n\n".join(rnd.sample(FOOTERS, rnd.randint(0, 3)))
+        posts.append(f"{body}\n\n{footer}".strip())
+    return posts
+
+
+def bench(func, posts, rounds):
+    start = time.perf_counter()
+    for i in range(rounds):
+        func(posts[i % len(posts)])
+    return (time.perf_counter() - start) / rounds
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=2000)
+    parser.add_argument("--posts", type=int, default=200)
+    parser.add_argument("--check", action="store_true")
+    args = parser.parse_args()
+
+    posts = make_posts(args.posts)
+
+    build_start = time.perf_counter()
+    cleaner = TextCleaner(load("replacements.json"), load("blacklist.json"))
+    build_time = time.perf_counter() - build_start
+
+    # בדיקת שקילות מול הגרסה המקורית
+    mismatches = [(p, legacy_clean_text(p), cleaner.clean(p)) for p in posts
+                  if legacy_clean_text(p) != cleaner.clean(p)]
+
+    legacy = bench(legacy_clean_text, posts, args.rounds)
+    cached = bench(cleaner.clean, posts, args.rounds)
+
+    print(f"build:    {build_time * 1000:.2f} ms (once per list change)")
+    print(f"legacy:   {legacy * 1e6:.1f} us/post")
+    print(f"cached:   {cached * 1e6:.1f} us/post  (x{legacy / cached:.1f})")
+    print(f"mismatches: {len(mismatches)}/{len(posts)}")
+    for post, old, new in mismatches[:5]:
+        print("-" * 40)
+        print("post:", post)
+        print("old: ", old)
+        print("new: ", new)
+
+    if args.check and mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
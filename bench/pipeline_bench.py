@@ -0,0 +1,423 @@
+"""מדידת תפוקה מקצה לקצה של handle_message בלי טלגרם, גוגל וימות.
+
+הרצה מתיקיית הפרויקט:
+    python bench/pipeline_bench.py [--messages 400] [--rate 0] [--upload-latency 0.2]
+    python bench/pipeline_bench.py --save-baseline      # שמירת התוצאה כבסיס להשוואה
+    python bench/pipeline_bench.py --check              # נכשל אם יש נסיגה מול הבסיס
+
+עדכונים סינתטיים (טקסט, הקלטה, וידאו ו-GIF) מכל הערוצים שב-CHANNELS_CONFIG
+נכנסים ל-handle_message. גוגל מוחלף בלקוח מקומי דטרמיניסטי שמחזיר צליל
+באורך שתלוי בטקסט, וימות והורדות הקבצים מטלגרם מוחלפים בשרת מקומי
+(bench/ymot_standin.py) עם השהיה שניתנת להגדרה. אם ffmpeg לא מותקן,
+המדיה מפוענחת ב-Python (והקליטה לא נמדדת באמת) - זה מצוין בתוצאה.
+
+הזמן מקצה לקצה נמדד מהכניסה ל-handle_message ועד התוצאה הסופית של
+העבודה (כולל סיום ההעלאות ברקע). הבסיס נשמר ב-bench/baselines.json לפי
+שם התרחיש, והוא תלוי במכונה: מומלץ לשמור בסיס חדש על המכונה שבודקים בה.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import math
+import os
+import random
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+from array import array
+from datetime import datetime, timezone
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+
+from audio import SAMPLE_RATE, build_wav, wav_to_pcm  # noqa: E402
+
+BASELINES_FILE = os.path.join(BENCH_DIR, "baselines.json")
+
+WORDS = (
+    "הממשלה אישרה הלילה תוכנית חדשה לחיזוק מערכת החינוך בצפון הארץ "
+    "ראש העיר הודיע כי העבודות בכביש הראשי יסתיימו בשבוע הבא "
+    "המשטרה פתחה בחקירה בעקבות תאונת דרכים קשה בצומת הסמוך "
+    "בית המשפט העליון דחה את העתירה ופסק כי ההחלטה תעמוד בעינה "
+    "שר האוצר הציג את עיקרי התקציב לשנה הקרובה בפני הוועדה "
+    "תחזית מזג האוויר צפויה ירידה בטמפרטורות וגשמים מקומיים בצפון ובמרכז "
+    "ההסתדרות הכריזה על סכסוך עבודה במשק בעקבות הקיצוצים המתוכננים"
+).split()
+
+
+# ---------------------------------------------------------
+# 🎤 לקוח TTS מקומי (במקום Google)
+# ---------------------------------------------------------
+def _tone(freq, seconds=1.0, amplitude=8000):
+    samples = array("h", (int(amplitude * math.sin(2 * math.pi * freq * i / SAMPLE_RATE))
+                          for i in range(int(SAMPLE_RATE * seconds))))
+    if sys.byteorder == "big":
+        samples.byteswap()
+    return samples.tobytes()
+
+
+class _Response:
+    def __init__(self, audio_content):
+        self.audio_content = audio_content
+
+
+class StubTTSClient:
+    """מחזיר WAV של צליל שאורכו לפי אורך הטקסט, אחרי השהיה קבועה + לפי תו"""
+
+    SECONDS_PER_CHAR = 0.06
+
+    def __init__(self, latency=0.15, per_char=0.0005):
+        self.latency = latency
+        self.per_char = per_char
+        self.calls = 0
+        self._tones = [_tone(freq) for freq in (220, 330, 440, 550, 660)]
+
+    async def synthesize_speech(self, input, voice=None, audio_config=None, retry=None, timeout=None):
+        text = input.text
+        self.calls += 1
+        await asyncio.sleep(self.latency + self.per_char * len(text))
+        tone = self._tones[zlib.crc32(text.encode("utf-8")) % len(self._tones)]
+        size = int(len(text) * self.SECONDS_PER_CHAR * SAMPLE_RATE) * 2
+        pcm = (tone * (size // len(tone) + 1))[:size]
+        return _Response(build_wav([pcm]))
+
+
+async def python_ingest(chunks, fallback_path, timeout=None):
+    """מחליף את ffmpeg כשהוא לא מותקן: הקבצים בבדיקה הם WAV בפורמט של ימות"""
+    from media_tools import IngestResult, LevelMeter
+    data = bytearray()
+    async for chunk in chunks:
+        data.extend(chunk)
+    pcm = wav_to_pcm(bytes(data))
+    meter = LevelMeter()
+    meter.feed(pcm)
+    return IngestResult(pcm, bool(pcm), meter)
+
+
+# ---------------------------------------------------------
+# 📨 עדכונים סינתטיים
+# ---------------------------------------------------------
+class FakeBot:
+    """מספק רק את get_file; הקבצים מוגשים מהשרת המקומי"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+
+    async def get_file(self, file_id, **kwargs):
+        from telegram import File
+        return File(file_id=file_id, file_unique_id=file_id, file_path=f"{self.base_url}/files/{file_id}")
+
+
+MEDIA_VARIANTS = 12
+
+
+def _melody(seed, seconds, amplitude=5000):
+    """צלילים משתנים כל 200ms, כדי שלכל קטע תהיה טביעת שמע משלו"""
+    rnd = random.Random(seed)
+    step = SAMPLE_RATE // 5
+    samples = array("h")
+    for _ in range(int(seconds * 5)):
+        freqs = [rnd.uniform(250, 3000) for _ in range(3)]
+        samples.extend(int(amplitude * sum(math.sin(2 * math.pi * f * i / SAMPLE_RATE) for f in freqs) / 3)
+                       for i in range(step))
+    if sys.byteorder == "big":
+        samples.byteswap()
+    return samples.tobytes()
+
+
+def write_media(directory):
+    os.makedirs(directory, exist_ok=True)
+    files = {"silent.wav": bytes(SAMPLE_RATE * 2 * 5)}
+    for k in range(MEDIA_VARIANTS):
+        files[f"voice{k}.wav"] = _melody(f"voice{k}", 6.0)
+        files[f"video{k}.wav"] = _melody(f"video{k}", 15.0)
+    for name, pcm in files.items():
+        with open(os.path.join(directory, name), "wb") as f:
+            f.write(build_wav([pcm]))
+
+
+def random_text(rnd, long_share=0.1):
+    count = rnd.randint(250, 400) if rnd.random() < long_share else rnd.randint(12, 60)
+    words = [rnd.choice(WORDS) for _ in range(count)]
+    # נקודות כדי שהחיתוך למשפטים יעבוד כמו בטקסט אמיתי
+    for i in range(rnd.randint(8, 15), count, rnd.randint(8, 15)):
+        words[i] += "."
+    return " ".join(words)
+
+
+def parse_mix(spec):
+    mix = {}
+    for part in spec.split(","):
+        kind, _, weight = part.partition("=")
+        mix[kind.strip()] = float(weight)
+    unknown = set(mix) - {"text", "voice", "video", "animation"}
+    if unknown:
+        raise SystemExit(f"סוג הודעה לא מוכר: {', '.join(sorted(unknown))}")
+    return mix
+
+
+def build_updates(channels, count, mix, dup_rate, bot, seed, cross_rate=0.0):
+    from telegram import Animation, Chat, Message, Update, Video, Voice
+    rnd = random.Random(seed)
+    kinds, weights = zip(*mix.items())
+    history = {chat_id: [] for chat_id in channels}
+    recent = []
+    updates = []
+    for i in range(1, count + 1):
+        chat_id = rnd.choice(channels)
+        kind = rnd.choices(kinds, weights)[0]
+        if history[chat_id] and rnd.random() < dup_rate:
+            text = rnd.choice(history[chat_id])
+        elif recent and rnd.random() < cross_rate:
+            # אותה ידיעה שפורסמה זה עתה בערוץ אחר
+            text = rnd.choice(recent[-10:])
+            history[chat_id].append(text)
+        else:
+            text = random_text(rnd)
+            history[chat_id].append(text)
+            recent.append(text)
+        fields = {}
+        if kind == "text":
+            fields["text"] = text
+        else:
+            # למדיה יש בדרך כלל כיתוב קצר, ולפעמים אין בכלל
+            fields["caption"] = " ".join(text.split()[:rnd.randint(0, 20)]) or None
+            # כל העלאה מקבלת מזהה משלה; קטע שחוזר על עצמו נתפס רק לפי טביעת השמע
+            if kind == "voice":
+                name = f"voice{rnd.randrange(MEDIA_VARIANTS)}.wav"
+                media = fields["voice"] = Voice(name, f"{name}#{i}", duration=6)
+            elif kind == "video":
+                name = "silent.wav" if rnd.random() < 0.2 else f"video{rnd.randrange(MEDIA_VARIANTS)}.wav"
+                media = fields["video"] = Video(name, f"{name}#{i}", width=640, height=360, duration=15)
+            else:
+                media = fields["animation"] = Animation("anim.mp4", "anim.mp4", width=320, height=240, duration=3)
+            media.set_bot(bot)
+        message = Message(message_id=i, date=datetime.now(timezone.utc),
+                          chat=Chat(id=chat_id, type=Chat.CHANNEL), **fields)
+        updates.append(Update(update_id=i, channel_post=message))
+    return updates
+
+
+# ---------------------------------------------------------
+# ⏱️ הרצה ומדידה
+# ---------------------------------------------------------
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_standin(args, files_dir):
+    port = free_port()
+    proc = subprocess.Popen(
+        [sys.executable, os.path.join(BENCH_DIR, "ymot_standin.py"), "--port", str(port),
+         "--latency", str(args.upload_latency), "--jitter", str(args.upload_jitter),
+         "--error-rate", str(args.upload_error_rate), "--drop-rate", str(args.upload_drop_rate),
+         "--files-dir", files_dir],
+        stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return proc, f"http://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.05)
+    proc.kill()
+    raise SystemExit("❌ השרת המקומי לא עלה")
+
+
+async def run(args, base_url):
+    import main
+    from metrics import FANOUT_REUSE, UPLOADS
+
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    stub = StubTTSClient(args.tts_latency, args.tts_per_char)
+    main.tts._prepare()
+    main.tts._clients = [stub]
+    main.tts._next_client = itertools.cycle(main.tts._clients)
+    media_mode = "ffmpeg"
+    if args.media == "python" or (args.media == "auto" and not shutil.which("ffmpeg")):
+        main.ingest_media = python_ingest
+        media_mode = "python"
+
+    if args.coalesce:
+        for config in main.CHANNELS_CONFIG.values():
+            config["coalesce_window"] = args.coalesce
+            config["coalesce_max_delay"] = args.coalesce * 5
+
+    channels = sorted(main.CHANNELS_CONFIG)
+    updates = build_updates(channels, args.messages, parse_mix(args.mix), args.dup_rate,
+                            FakeBot(base_url), args.seed, args.cross_rate)
+
+    latencies = []
+    outcomes = {}
+    done = asyncio.Event()
+    finish_job = main.finish_job
+
+    def record(job_id, chat_id, received_at, outcome):
+        finish_job(job_id, chat_id, received_at, outcome)
+        latencies.append(time.perf_counter() - received_at)
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+        if len(latencies) >= len(updates):
+            done.set()
+
+    main.finish_job = record
+    await main.on_startup(None)
+
+    rnd = random.Random(args.seed + 1)
+    started = time.perf_counter()
+    for update in updates:
+        await main.handle_message(update, None)
+        if args.rate > 0:
+            await asyncio.sleep(rnd.expovariate(args.rate))
+    try:
+        await asyncio.wait_for(done.wait(), args.timeout)
+    except asyncio.TimeoutError:
+        logging.error(f"❌ רק {len(latencies)} מתוך {len(updates)} עבודות הסתיימו בזמן")
+    elapsed = time.perf_counter() - started
+    await main.on_shutdown(None)
+
+    return {
+        "messages": len(latencies),
+        "elapsed_s": round(elapsed, 3),
+        "msgs_per_sec": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_s": round(percentile(latencies, 50) or 0, 4),
+        "p95_s": round(percentile(latencies, 95) or 0, 4),
+        "p99_s": round(percentile(latencies, 99) or 0, 4),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "outcomes": dict(sorted(outcomes.items())),
+        "tts_calls": stub.calls,
+        "uploads": UPLOADS.value("ok"),
+        "shared_renders": FANOUT_REUSE.value("tts") + FANOUT_REUSE.value("media"),
+        "media": media_mode,
+    }
+
+
+# ---------------------------------------------------------
+# 📏 השוואה לבסיס
+# ---------------------------------------------------------
+# (מדד, כיוון): 1 = גבוה יותר טוב, -1 = נמוך יותר טוב
+CHECKS = (("msgs_per_sec", 1), ("p50_s", -1), ("p95_s", -1), ("p99_s", -1), ("peak_rss_mb", -1))
+
+
+def load_baselines():
+    if not os.path.exists(BASELINES_FILE):
+        return {}
+    with open(BASELINES_FILE, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def compare(result, baseline, tolerance):
+    regressions = []
+    for metric, direction in CHECKS:
+        old, new = baseline["result"].get(metric), result.get(metric)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        mark = ""
+        if change * direction < -tolerance:
+            mark = "  ⟵ נסיגה"
+            regressions.append(metric)
+        print(f"  {metric:<13} {old:>10} → {new:<10} ({change:+.1%}){mark}")
+    return regressions
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", default="default", help="שם התרחיש בקובץ הבסיס")
+    parser.add_argument("--messages", type=int, default=400)
+    parser.add_argument("--rate", type=float, default=0.0, help="הודעות לשנייה (0 = הכל בבת אחת)")
+    parser.add_argument("--mix", default="text=60,voice=15,video=15,animation=10")
+    parser.add_argument("--dup-rate", type=float, default=0.05, help="שיעור הודעות כפולות")
+    parser.add_argument("--cross-rate", type=float, default=0.0, help="שיעור ידיעות שמתפרסמות שוב בערוץ אחר")
+    parser.add_argument("--tts-latency", type=float, default=0.15)
+    parser.add_argument("--tts-per-char", type=float, default=0.0005)
+    parser.add_argument("--upload-latency", type=float, default=0.2)
+    parser.add_argument("--upload-jitter", type=float, default=0.05)
+    parser.add_argument("--upload-error-rate", type=float, default=0.0)
+    parser.add_argument("--upload-drop-rate", type=float, default=0.0, help="שיעור חלקים שהחיבור שלהם מנותק")
+    parser.add_argument("--chunk-threshold-kb", type=int, default=0, help="סף העלאה בחלקים (0 = לפי ההגדרות)")
+    parser.add_argument("--coalesce", type=float, default=0.0, help="חלון איחוד הודעות לכל הערוצים (0 = לפי ההגדרות)")
+    parser.add_argument("--media", choices=("auto", "ffmpeg", "python"), default="auto")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--check", action="store_true", help="יציאה עם קוד 1 אם יש נסיגה מול הבסיס")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="סטייה מותרת מהבסיס (0.2 = 20%%)")
+    parser.add_argument("--verbose", action="store_true", help="להציג את הלוגים של הבוט")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="mozik_bench_")
+    files_dir = os.path.join(workdir, "files")
+    write_media(files_dir)
+    standin, base_url = start_standin(args, files_dir)
+
+    # הבוט רץ בתיקייה זמנית משלו: מאגר מצב, מטמון TTS ולוג חדשים בכל הרצה
+    for name in ("blacklist.json", "replacements.json"):
+        if os.path.exists(os.path.join(ROOT, name)):
+            shutil.copy(os.path.join(ROOT, name), workdir)
+    os.environ.update({
+        "BOT_TOKEN": "bench",
+        "YMOT_TOKEN": "bench",
+        "YMOT_API_URL": f"{base_url}/ym/api/",
+        "STATE_DB": os.path.join(workdir, "bot_state.db"),
+        "TTS_CACHE_DIR": os.path.join(workdir, "tts_cache"),
+    })
+    if args.chunk_threshold_kb:
+        os.environ["YMOT_CHUNK_THRESHOLD_KB"] = str(args.chunk_threshold_kb)
+        os.environ["YMOT_CHUNK_SIZE_KB"] = str(max(1, args.chunk_threshold_kb // 4))
+    os.chdir(workdir)
+    try:
+        result = asyncio.run(run(args, base_url))
+    finally:
+        standin.kill()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    params = {k: v for k, v in vars(args).items()
+              if k not in ("scenario", "save_baseline", "check", "tolerance", "verbose", "timeout")}
+    print(json.dumps({"scenario": args.scenario, "result": result}, ensure_ascii=False, indent=2))
+
+    baselines = load_baselines()
+    baseline = baselines.get(args.scenario)
+    regressions = []
+    if baseline and not args.save_baseline:
+        if baseline.get("params") != params:
+            print("⚠️ הפרמטרים שונים מאלה של הבסיס, ההשוואה לא בהכרח משמעותית.")
+        print(f"השוואה לבסיס '{args.scenario}' (סטייה מותרת {args.tolerance:.0%}):")
+        regressions = compare(result, baseline, args.tolerance)
+
+    if args.save_baseline:
+        baselines[args.scenario] = {"params": params, "result": result}
+        with open(BASELINES_FILE, "w", encoding="utf-8") as f:
+            json.dump(baselines, f, ensure_ascii=False, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"💾 הבסיס נשמר ב-{os.path.relpath(BASELINES_FILE, ROOT)}")
+
+    if args.check:
+        if not baseline:
+            raise SystemExit(f"❌ אין בסיס לתרחיש '{args.scenario}'")
+        if regressions:
+            raise SystemExit(f"❌ נסיגה ב: {', '.join(regressions)}")
+        print("✅ אין נסיגה מול הבסיס")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,201 @@
+"""שרת מקומי שמחקה את call2all (UploadFile) ואת הורדת הקבצים מטלגרם.
+
+הרצה עצמאית:
+    python bench/ymot_standin.py --port 8765 --latency 0.2 --jitter 0.1 --error-rate 0.02
+
+    POST /ym/api/UploadFile  - ממתין את זמן ההשהיה ומחזיר responseStatus OK
+                               (או --error-status, ברירת מחדל 503, לפי --error-rate)
+                               עם qquuid/qqpartindex: שומר חלק של העלאה בחלקים
+                               (--drop-rate מנתק את החיבור בלי תשובה, כמו רשת שנפלה)
+    POST /ym/api/UploadFile?done - מרכיב את החלקים ובודק שכולם הגיעו ושהגודל תואם
+    GET  /ym/api/GetIVR2Dir?path=... - רשימת הקבצים שהועלו לשלוחה
+    GET  /files/<name>       - מגיש קובץ מתיקיית --files-dir (מחליף את שרתי הקבצים של טלגרם)
+    GET  /stats              - מספר ההעלאות, הבתים שהתקבלו והשגיאות שהוחזרו
+"""
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+def parse_form(content_type, body):
+    """מחזיר (שדות, קבצים) מגוף multipart/form-data או urlencoded"""
+    if content_type.startswith("multipart/form-data"):
+        message = BytesParser(policy=HTTP).parsebytes(
+            b"Content-Type: " + content_type.encode() + b"\r\n\r\n" + body)
+        fields, files = {}, {}
+        for part in message.iter_parts():
+            name = part.get_param("name", header="content-disposition")
+            payload = part.get_payload(decode=True) or b""
+            if part.get_filename() is not None:
+                files[name] = payload
+            else:
+                fields[name] = payload.decode("utf-8")
+        return fields, files
+    return {k: v[-1] for k, v in parse_qs(body.decode("utf-8"), keep_blank_values=True).items()}, {}
+
+
+class StandIn(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0, jitter=0.0, error_rate=0.0, files_dir=None, seed=7, drop_rate=0.0,
+                 error_status=503, error_after_store=False):
+        super().__init__(address, Handler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        # השגיאה מוחזרת אחרי שהקובץ כבר נשמר (כמו 504 משער שוויתר על התשובה)
+        self.error_after_store = error_after_store
+        self.drop_rate = drop_rate
+        self.files_dir = files_dir
+        self.rnd = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {"uploads": 0, "bytes": 0, "errors": 0, "parts": 0, "dropped": 0, "chunked": 0}
+        self.transfers = {}    # qquuid -> {qqpartindex: bytes}
+        self.received = []     # (path, bytes) של העלאות שהושלמו
+        self.folders = {}      # path -> שמות הקבצים שנשמרו בשלוחה
+
+    def delay(self):
+        with self.lock:
+            return max(0.0, self.latency + self.rnd.uniform(-self.jitter, self.jitter))
+
+    def should_fail(self):
+        with self.lock:
+            return self.rnd.random() < self.error_rate
+
+    def should_drop(self):
+        with self.lock:
+            return self.rnd.random() < self.drop_rate
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, body, content_type="application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path.rstrip("/").endswith("GetIVR2Dir"):
+            path = parse_qs(url.query).get("path", [""])[-1]
+            with self.server.lock:
+                names = list(self.server.folders.get(path, ()))
+            files = [{"name": name, "fileType": "AUDIO"} for name in names]
+            return self._reply(200, json.dumps({"responseStatus": "OK", "files": files}).encode())
+        if self.path == "/stats":
+            with self.server.lock:
+                body = json.dumps(self.server.stats).encode()
+            return self._reply(200, body)
+        if self.path.startswith("/files/") and self.server.files_dir:
+            name = os.path.basename(self.path[len("/files/"):])
+            path = os.path.join(self.server.files_dir, name)
+            if os.path.isfile(path):
+                with open(path, "rb") as f:
+                    return self._reply(200, f.read(), "application/octet-stream")
+        self._reply(404, b'{"responseStatus":"ERROR","message":"not found"}')
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length)
+        url = urlsplit(self.path)
+        if not url.path.rstrip("/").endswith("UploadFile"):
+            return self._reply(404, b'{"responseStatus":"ERROR","message":"unknown api"}')
+        fields, files = parse_form(self.headers.get("Content-Type", ""), body)
+        if "qqpartindex" in fields:
+            return self._upload_part(fields, files)
+        time.sleep(self.server.delay())
+        if self.server.should_fail():
+            with self.server.lock:
+                self.server.stats["errors"] += 1
+            if self.server.error_after_store and url.query != "done":
+                self._store(fields.get("path"), files.get("file", b""))
+            return self._reply(self.server.error_status, b"Service Unavailable", "text/plain")
+        if url.query == "done":
+            return self._finish_chunked(fields)
+        data = files.get("file", b"")
+        self._complete(fields.get("path"), data)
+
+    def _store(self, path, data, chunked=False):
+        with self.server.lock:
+            self.server.stats["uploads"] += 1
+            self.server.stats["bytes"] += len(data)
+            self.server.stats["chunked"] += chunked
+            self.server.received.append((path, data))
+            folder = self.server.folders.setdefault(path, [])
+            name = f"{len(folder):03d}.wav"
+            folder.append(name)
+        return name
+
+    def _complete(self, path, data, chunked=False):
+        name = self._store(path, data, chunked)
+        self._reply(200, json.dumps({"responseStatus": "OK", "path": name}).encode())
+
+    def _upload_part(self, fields, files):
+        # חלק נשלח בזמן יחסי לגודלו, כמו בקישור אמיתי
+        time.sleep(self.server.delay() / 4)
+        if self.server.should_drop():
+            with self.server.lock:
+                self.server.stats["dropped"] += 1
+            # ניתוק בלי תשובה; הלקוח רואה שגיאת רשת ושולח את החלק שוב
+            self.close_connection = True
+            self.connection.shutdown(2)
+            return
+        chunk = files.get("qqfile", b"")
+        if len(chunk) != int(fields.get("qqchunksize", -1)):
+            return self._reply(200, b'{"responseStatus":"ERROR","message":"chunk size mismatch"}')
+        with self.server.lock:
+            self.server.transfers.setdefault(fields["qquuid"], {})[int(fields["qqpartindex"])] = chunk
+            self.server.stats["parts"] += 1
+        self._reply(200, b'{"success":true}')
+
+    def _finish_chunked(self, fields):
+        with self.server.lock:
+            parts = self.server.transfers.pop(fields.get("qquuid"), {})
+        total_parts = int(fields.get("qqtotalparts", 0))
+        missing = [i for i in range(total_parts) if i not in parts]
+        data = b"".join(parts[i] for i in sorted(parts))
+        if missing or len(data) != int(fields.get("qqtotalfilesize", -1)):
+            message = f"missing parts {missing}" if missing else "size mismatch"
+            return self._reply(200, json.dumps({"responseStatus": "ERROR", "message": message}).encode())
+        self._complete(fields.get("path"), data, chunked=True)
+
+
+def start(port=0, **kwargs):
+    """מפעיל את השרת בת'רד רקע ומחזיר אותו (server.server_port הוא הפורט בפועל)"""
+    server = StandIn(("127.0.0.1", port), **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.2, help="השהיה לכל העלאה (שניות)")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="שיעור תשובות שגיאה")
+    parser.add_argument("--error-status", type=int, default=503, help="קוד ה-HTTP של תשובות השגיאה")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="שיעור חלקים שהחיבור שלהם מנותק")
+    parser.add_argument("--files-dir", default=None)
+    args = parser.parse_args()
+    server = StandIn(("127.0.0.1", args.port), args.latency, args.jitter, args.error_rate, args.files_dir,
+                     drop_rate=args.drop_rate, error_status=args.error_status)
+    print(f"call2all stand-in on http://127.0.0.1:{server.server_port}/ym/api/")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
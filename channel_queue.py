@@ -0,0 +1,113 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import logging
+import time
+
+from metrics import QUEUE_WAIT_SECONDS
+
+# ---------------------------------------------------------
+# 🚦 תור עבודות לכל ערוץ
+# ---------------------------------------------------------
+# לכל ערוץ יש תור ועובד משלו, וערוצים שונים מעובדים במקביל עד לתקרה
+# גלובלית של עבודות. לכל עבודה יש עדיפות (מספר קטן = דחוף יותר):
+# בתוך הערוץ עבודה דחופה עוקפת עבודות פחות דחופות שממתינות, וגם
+# המקומות הפנויים בתקרה הגלובלית ניתנים קודם לעבודות הדחופות.
+# בין עבודות באותה עדיפות הסדר הוא סדר ההגעה.
+# כל עבודה רצה בהקשר (contextvars) של מי ששלח אותה, כך שמזהה המעקב
+# בלוגים (ראו job_log.py) ממשיך איתה גם דרך התור.
+
+
+class PrioritySlots:
+    """כמו Semaphore, אבל מקום שהתפנה עובר להמתנה הדחופה ביותר"""
+
+    def __init__(self, value):
+        self._free = value
+        self._waiters = []
+        self._seq = itertools.count()
+
+    async def acquire(self, priority=0):
+        if self._free > 0 and not self._waiters:
+            self._free -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            # אם המקום כבר הועבר אלינו ברגע הביטול - מעבירים אותו הלאה
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self._free += 1
+
+
+class ChannelDispatcher:
+    def __init__(self, handler, max_concurrency=2, name="jobs"):
+        self._handler = handler
+        self.name = name
+        self._slots = PrioritySlots(max_concurrency)
+        self._queues = {}
+        self._workers = {}
+        self._seq = itertools.count()
+        self._pending_by_priority = {}
+
+    def submit(self, chat_id, job, priority=0):
+        """מוסיף עבודה לתור של הערוץ ומפעיל את העובד שלו במידת הצורך"""
+        queue = self._queues.get(chat_id)
+        if queue is None:
+            queue = self._queues[chat_id] = asyncio.PriorityQueue()
+        queue.put_nowait((priority, next(self._seq), job, time.perf_counter(), contextvars.copy_context()))
+        self._pending_by_priority[priority] = self._pending_by_priority.get(priority, 0) + 1
+
+        worker = self._workers.get(chat_id)
+        if worker is None or worker.done():
+            self._workers[chat_id] = asyncio.create_task(self._worker(chat_id, queue))
+
+    def pending(self, chat_id):
+        queue = self._queues.get(chat_id)
+        return queue.qsize() if queue else 0
+
+    def total_pending(self):
+        return sum(queue.qsize() for queue in list(self._queues.values()))
+
+    def pending_by_priority(self):
+        """מספר העבודות שממתינות לכל עדיפות (כולל כאלה שמחכות למקום פנוי)"""
+        return dict(self._pending_by_priority)
+
+    async def _worker(self, chat_id, queue):
+        while True:
+            priority, _, job, enqueued_at, context = await queue.get()
+            try:
+                await self._slots.acquire(priority)
+                self._pending_by_priority[priority] -= 1
+                try:
+                    QUEUE_WAIT_SECONDS.observe(time.perf_counter() - enqueued_at, self.name)
+                    await context.run(asyncio.create_task, self._handler(job))
+                finally:
+                    self._slots.release()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                context.run(logging.exception, f"❌ שגיאה בעיבוד הודעה מערוץ {chat_id}: {e}")
+            finally:
+                queue.task_done()
+
+    async def join(self):
+        """ממתין עד שכל התורים מתרוקנים"""
+        for queue in list(self._queues.values()):
+            await queue.join()
+
+    async def shutdown(self):
+        for worker in self._workers.values():
+            worker.cancel()
+        await asyncio.gather(*self._workers.values(), return_exceptions=True)
+        self._workers.clear()
@@ -0,0 +1,100 @@
+import asyncio
+import logging
+import time
+
+# ---------------------------------------------------------
+# 🧺 איחוד פרצי הודעות למבזק אחד
+# ---------------------------------------------------------
+# הודעות טקסט שמגיעות בזו אחר זו נאספות, וכל עוד מגיעה הודעה חדשה
+# בתוך החלון הזמן מתארך - אבל לא מעבר לתקרת ההשהיה מההודעה הראשונה,
+# כדי שמבזק דחוף לא יחכה. בסוף החלון כל ההודעות נשלחות ל-handler
+# יחד, וכל הודעה מקבלת Future שמסתיים כשהמבזק המאוחד הועלה.
+
+
+class BurstCoalescer:
+    def __init__(self, handler, window, max_delay, name=""):
+        self._handler = handler          # async handler(items) -> Future של ההעלאה, או None
+        self.window = window
+        self.max_delay = max(window, max_delay)
+        self.name = name
+        self._batch = None
+        self._lock = asyncio.Lock()
+
+    def add(self, item):
+        """מוסיף פריט למבזק הפתוח ומחזיר Future שמסתיים עם ההעלאה שלו"""
+        loop = asyncio.get_running_loop()
+        now = time.monotonic()
+        batch = self._batch
+        if batch is None:
+            batch = self._batch = _Batch(loop, now)
+        else:
+            batch.timer.cancel()
+        batch.items.append(item)
+        # השהיה מתחדשת עם כל הודעה, עד התקרה מההודעה הראשונה
+        delay = min(now + self.window, batch.started + self.max_delay) - now
+        batch.timer = loop.call_later(max(0.0, delay), self._schedule, batch)
+        return batch.future
+
+    @property
+    def pending(self):
+        return len(self._batch.items) if self._batch else 0
+
+    def _schedule(self, batch):
+        batch.task = asyncio.create_task(self._flush(batch))
+
+    async def flush(self):
+        """שולח מיד את המבזק הפתוח (למשל לפני מדיה, כדי לשמור על הסדר בשלוחה)"""
+        batch = self._batch
+        if batch is not None:
+            await self._flush(batch)
+        else:
+            # ממתין גם למבזק שכבר נשלח ועדיין בהכנה
+            async with self._lock:
+                pass
+
+    async def _flush(self, batch):
+        async with self._lock:
+            if self._batch is not batch:
+                return
+            self._batch = None
+            batch.timer.cancel()
+            try:
+                upload = await self._handler(batch.items)
+            except Exception as e:
+                logging.exception(f"❌ שגיאה בהכנת מבזק מאוחד {self.name}: {e}")
+                _set_exception(batch.future, e)
+                return
+        if upload is None:
+            _set_exception(batch.future, RuntimeError("המבזק המאוחד לא נוצר"))
+        else:
+            upload.add_done_callback(lambda f: _chain(f, batch.future))
+
+    async def close(self):
+        await self.flush()
+
+
+class _Batch:
+    def __init__(self, loop, started):
+        self.started = started
+        self.items = []
+        self.future = loop.create_future()
+        self.timer = None
+        self.task = None
+
+
+def _set_exception(future, error):
+    if not future.done():
+        future.set_exception(error)
+        # מונע אזהרת "exception never retrieved" אם אף אחד לא ממתין
+        future.exception()
+
+
+def _chain(source, target):
+    if target.done():
+        return
+    if source.cancelled():
+        target.cancel()
+    elif source.exception() is not None:
+        _set_exception(target, source.exception())
+    else:
+        target.set_result(source.result())
@@ -0,0 +1,151 @@
+import logging
+import random
+import zlib
+from collections import deque
+
+# ---------------------------------------------------------
+# 🚫 זיהוי הודעות כמעט-כפולות (MinHash + LSH)
+# ---------------------------------------------------------
+# כל הודעה מיוצגת ע"י קבוצת רצפי מילים (shingles) וחתימת MinHash
+# קצרה. החתימות מחולקות לרצועות (bands) שנשמרות בטבלאות גיבוב,
+# כך שבדיקה מול אלפי הודעות קודמות בודקת רק מועמדים שחולקים
+# רצועה, בלי לעבור על כל ההיסטוריה.
+# הדמיון הוא Jaccard בין קבוצות הרצפים (0 עד 1).
+
+NUM_PERM = 64
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+# פרמטרים קבועים (זרע קבוע) כדי שחתימות שנשמרו בדיסק יישארו תקפות
+_rnd = random.Random(1103)
+_PERMS = [(_rnd.randrange(1, _PRIME), _rnd.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+
+def shingles(text, size=2):
+    words = text.split()
+    if len(words) < size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def minhash(items):
+    hashes = [zlib.crc32(item.encode("utf-8")) for item in items]
+    if not hashes:
+        return None
+    return [min((a * h + b) % _PRIME for h in hashes) & _MAX_HASH for a, b in _PERMS]
+
+
+def similarity(sig_a, sig_b):
+    """הערכת דמיון Jaccard לפי אחוז הרכיבים הזהים בחתימות"""
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / len(sig_a)
+
+
+def _choose_rows(threshold):
+    # בוחרים מספר שורות לרצועה כך שסף ה-LSH יהיה מעט מתחת לסף הרצוי,
+    # כדי לא לפספס כפילויות. המועמדים מאומתים אח"כ מול החתימה המלאה.
+    best = 1
+    for rows in (1, 2, 4, 8, 16):
+        bands = NUM_PERM // rows
+        if (1 / bands) ** (1 / rows) <= threshold * 0.85:
+            best = rows
+    return best
+
+
+class DuplicateIndex:
+    def __init__(self, threshold=0.5, window=2000, shingle_size=2, store=None, chat_id=None):
+        self.threshold = threshold
+        self.window = window
+        self.shingle_size = shingle_size
+        self.store = store
+        self.chat_id = chat_id
+        self.rows = _choose_rows(threshold)
+        self.bands = NUM_PERM // self.rows
+        self._items = deque()        # (id, signature) מהישן לחדש
+        self._signatures = {}
+        self._buckets = [dict() for _ in range(self.bands)]
+        self._next_id = 0
+        self._appended = 0
+        self._last_row = 0           # השורה האחרונה במאגר שכבר נטענה
+        if store is not None:
+            self._load()
+
+    def __len__(self):
+        return len(self._items)
+
+    def _band_keys(self, sig):
+        r = self.rows
+        return [tuple(sig[i * r:(i + 1) * r]) for i in range(self.bands)]
+
+    def signature(self, text):
+        return minhash(shingles(text, self.shingle_size))
+
+    def find(self, sig):
+        """מחזיר את הדמיון הגבוה ביותר מעל הסף מבין המועמדים, או None"""
+        candidates = set()
+        for bucket, key in zip(self._buckets, self._band_keys(sig)):
+            ids = bucket.get(key)
+            if ids:
+                candidates.update(ids)
+        best = None
+        for item_id in candidates:
+            score = similarity(sig, self._signatures[item_id])
+            if score >= self.threshold and (best is None or score > best):
+                best = score
+        return best
+
+    def check_and_add(self, text):
+        """בודק אם הטקסט כפול; אם לא - מוסיף אותו להיסטוריה. מחזיר (כפול?, דמיון)"""
+        sig = self.signature(text)
+        if sig is None:
+            return False, 0.0
+        score = self.find(sig)
+        if score is not None:
+            return True, score
+        self.add(sig)
+        return False, 0.0
+
+    def add(self, sig, persist=True):
+        item_id = self._next_id
+        self._next_id += 1
+        self._items.append((item_id, sig))
+        self._signatures[item_id] = sig
+        for bucket, key in zip(self._buckets, self._band_keys(sig)):
+            bucket.setdefault(key, set()).add(item_id)
+        while len(self._items) > self.window:
+            self._evict()
+        if persist and self.store is not None:
+            self._persist(sig)
+
+    def _evict(self):
+        item_id, sig = self._items.popleft()
+        del self._signatures[item_id]
+        for bucket, key in zip(self._buckets, self._band_keys(sig)):
+            ids = bucket.get(key)
+            if ids is not None:
+                ids.discard(item_id)
+                if not ids:
+                    del bucket[key]
+
+    # --- שמירה במאגר המצב (שורה לכל הודעה, גיזום מדי פעם) ---
+    def _load(self):
+        self.refresh()
+
+    def refresh(self):
+        """טוען חתימות שנוספו למאגר מאז הטעינה האחרונה (ע"י תהליך אחר)"""
+        if self.store is None:
+            return
+        for row_id, sig in self.store.load_history(self.chat_id, self.window, after=self._last_row):
+            self._last_row = row_id
+            if isinstance(sig, list) and len(sig) == NUM_PERM:
+                self.add(sig, persist=False)
+
+    def _persist(self, sig):
+        try:
+            self._last_row = max(self._last_row, self.store.append_history(self.chat_id, sig))
+            self._appended += 1
+            # גיזום מדי פעם, כדי שההיסטוריה בדיסק לא תגדל בלי סוף
+            if self._appended >= self.window:
+                self.store.trim_history(self.chat_id, self.window)
+                self._appended = 0
+        except Exception as e:
+            logging.error(f"❌ שגיאה בשמירת היסטוריית כפילויות: {e}")
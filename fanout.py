@@ -0,0 +1,87 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+# ---------------------------------------------------------
+# ♻️ שיתוף עיבוד בין ערוצים
+# ---------------------------------------------------------
+# אותה ידיעה מגיעה לעתים קרובות לכמה ערוצים בהפרש של שניות. כל
+# עיבוד יקר (המרת מדיה, הקראה) נרשם לפי מפתח התוכן שלו: מי שמבקש
+# את אותו מפתח בזמן שהעיבוד רץ ממתין לאותה תוצאה, ותוצאה מוצלחת
+# נשמרת לזמן קצר כדי שגם עותק שמגיע מעט אחר כך ישתמש בה.
+#
+# תוצאות (למשל PCM מפוענח) יכולות להיות גדולות, ולכן הן לא נשארות בזיכרון
+# אחרי החלון: פגות התוקף נמחקות בכל בקשה ובטיימר בסוף החלון, והמטמון
+# מוגבל גם במספר התוצאות וגם בסך הבתים שלהן.
+
+
+class _Abandoned(Exception):
+    """העיבוד המשותף בוטל אצל מי שהריץ אותו; הממתינים מריצים בעצמם"""
+
+
+class RenderCache:
+    """size: פונקציה שמחזירה את גודל התוצאה בבתים, למגבלת max_bytes"""
+
+    def __init__(self, window=180.0, max_items=64, on_reuse=None, max_bytes=None, size=None):
+        self.window = window
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self._size = size
+        self._on_reuse = on_reuse
+        self._entries = OrderedDict()   # key -> (תפוגה, Future, בתים)
+        self.total_bytes = 0
+
+    async def get_or_render(self, key, render):
+        """מחזיר את התוצאה ל-key; מריץ את render() רק אם אין תוצאה משותפת.
+        תוצאה None או חריגה לא נשמרות, כך שהעותק הבא ינסה שוב."""
+        self._prune()
+        entry = self._entries.get(key)
+        if entry is not None:
+            future = entry[1]
+            if self._on_reuse:
+                self._on_reuse(key)
+            try:
+                # shield: ביטול של ממתין אחד לא מבטל את העיבוד של כולם
+                return await asyncio.shield(future)
+            except _Abandoned:
+                return await self.get_or_render(key, render)
+
+        future = asyncio.get_running_loop().create_future()
+        self._entries[key] = (float("inf"), future, 0)
+        try:
+            result = await render()
+        except BaseException as e:
+            self._entries.pop(key, None)
+            future.set_exception(_Abandoned() if isinstance(e, asyncio.CancelledError) else e)
+            future.exception()
+            raise
+        future.set_result(result)
+        self._entries.pop(key, None)
+        size = self._size(result) if self._size and result is not None else 0
+        fits = self.max_bytes is None or size <= self.max_bytes
+        if result is not None and self.window > 0 and fits:
+            self._entries[key] = (time.monotonic() + self.window, future, size)
+            self.total_bytes += size
+            self._prune()
+            # גם בלי בקשות נוספות התוצאה לא נשארת בזיכרון אחרי החלון
+            asyncio.get_running_loop().call_later(self.window, self._prune)
+        return result
+
+    def _prune(self):
+        now = time.monotonic()
+        for key in [k for k, (expires, f, _) in self._entries.items() if f.done() and expires <= now]:
+            self._evict(key)
+        # מהישן לחדש, רק תוצאות מוכנות (עיבוד שרץ עדיין לא תופס זיכרון כאן)
+        while len(self._entries) > self.max_items or (
+                self.max_bytes is not None and self.total_bytes > self.max_bytes):
+            oldest = next((k for k, (_, f, _) in self._entries.items() if f.done()), None)
+            if oldest is None:
+                break
+            self._evict(oldest)
+
+    def _evict(self, key):
+        _, _, size = self._entries.pop(key)
+        self.total_bytes -= size
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,145 @@
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import time
+from contextlib import contextmanager
+
+from metrics import STAGE_SECONDS
+
+# ---------------------------------------------------------
+# 🧾 לוגים: כתיבה ברקע, סיבוב קבצים ומזהה מעקב לכל עבודה
+# ---------------------------------------------------------
+# כל רשומה נכנסת לתור בזיכרון (QueueHandler), ות'רד נפרד (QueueListener)
+# כותב אותה לקובץ ולמסוף - לולאת האירועים לא מחכה לדיסק. הקובץ מתחלף
+# לפי גודל (או לפי זמן), ונשמרים רק כמה קבצים ישנים.
+#
+# לכל הודעה יש מזהה מעקב (trace) שעובר בין השלבים דרך contextvars: משימות
+# ותורים שנוצרים בתוך העבודה יורשים אותו, כך ש-grep על המזהה מחזיר את
+# כל ציר הזמן של ההודעה - קליטה, ניקוי, כפילויות, הקראה, הרכבה והעלאה.
+# שדות נוספים (ערוץ, שלב, משך, בתים) נכתבים כ-key=value, או כ-JSON.
+
+trace_id = contextvars.ContextVar("trace_id", default="-")
+channel = contextvars.ContextVar("channel", default=None)
+
+TEXT_FORMAT = "%(asctime)s | %(levelname)s | %(trace_id)s | %(message)s"
+
+_listener = None
+
+
+class ContextFilter(logging.Filter):
+    """מצמיד לרשומה את מזהה המעקב והערוץ, עוד בהקשר של מי שכתב אותה"""
+
+    def filter(self, record):
+        record.trace_id = trace_id.get()
+        fields = getattr(record, "fields", None) or {}
+        if channel.get() is not None and "channel" not in fields:
+            fields = {"channel": channel.get(), **fields}
+        record.fields = fields
+        return True
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        text = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            text += " | " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return text
+
+
+class JsonFormatter(logging.Formatter):
+    """שורת JSON לכל רשומה, לחיפוש ולעיבוד אוטומטי"""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "trace": getattr(record, "trace_id", "-"),
+            "msg": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def setup_logging(filename="log.txt", level=logging.INFO, file_format="text",
+                  max_bytes=10 * 1024 * 1024, backups=5, rotate_when=None):
+    """מחליף את ה-handlers של ה-root ב-QueueHandler ומפעיל את הכותב ברקע.
+    rotate_when (למשל "midnight") מחליף את הקובץ לפי זמן במקום לפי גודל.
+    filename=None כותב רק למסוף. כל תהליך צריך קובץ משלו: שני תהליכים
+    שמסובבים את אותו קובץ דורסים זה לזה את הקבצים הישנים."""
+    global _listener
+    handlers = []
+    if filename is not None:
+        if rotate_when:
+            file_handler = logging.handlers.TimedRotatingFileHandler(
+                filename, when=rotate_when, backupCount=backups, encoding="utf-8")
+        else:
+            file_handler = logging.handlers.RotatingFileHandler(
+                filename, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+        file_handler.setFormatter(JsonFormatter() if file_format == "json" else TextFormatter(TEXT_FORMAT))
+        handlers.append(file_handler)
+    console = logging.StreamHandler()
+    console.setFormatter(TextFormatter(TEXT_FORMAT))
+    handlers.append(console)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    stop_logging()
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """כותב את מה שנשאר בתור ועוצר את הת'רד (בכיבוי)"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+def log_event(message, level=logging.INFO, **fields):
+    logging.log(level, message, extra={"fields": fields})
+
+
+@contextmanager
+def job_context(trace, chat_id=None):
+    """קובע את מזהה המעקב (והערוץ) לכל מה שרץ בתוך הבלוק"""
+    trace_token = trace_id.set(trace)
+    channel_token = channel.set(chat_id)
+    try:
+        yield
+    finally:
+        channel.reset(channel_token)
+        trace_id.reset(trace_token)
+
+
+@contextmanager
+def log_stage(stage, **fields):
+    """מודד שלב (STAGE_SECONDS) ורושם אותו בלוג עם המשך. הבלוק מקבל את
+    מילון השדות ויכול להוסיף לו, למשל fields["bytes"] אחרי שהתוצאה ידועה."""
+    started = time.perf_counter()
+    try:
+        yield fields
+    except BaseException as e:
+        fields["error"] = type(e).__name__
+        raise
+    finally:
+        duration = time.perf_counter() - started
+        STAGE_SECONDS.observe(duration, stage)
+        log_event(f"⏱️ {stage}", stage=stage, duration=round(duration, 4), **fields)
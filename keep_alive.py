@@ -1,22 +1,93 @@
-from flask import Flask
-from threading import Thread
+import json
+import logging
+import secrets
+
+from tornado.web import Application, RequestHandler
+from tornado.httpserver import HTTPServer
+from telegram import Update
+
+import metrics
+
+# ---------------------------------------------------------
+# 🌐 שרת HTTP אחד (tornado) בתוך לולאת האירועים של הבוט
+# ---------------------------------------------------------
+# משרת את דף החיים, את /wakeup של ימות, בדיקת בריאות, מדדים,
+# ובמצב webhook גם את העדכונים שטלגרם דוחפת. העדכון נכנס ישר לתור
+# העדכונים של הבוט והתשובה לטלגרם חוזרת מיד, בלי לחכות לעיבוד.
 
-app = Flask('')
 
 # --- החלק הקיים (לא שונה) ---
-@app.route('/')
-def home():
-    return "הבוט חי!"
+class HomeHandler(RequestHandler):
+    def get(self):
+        self.write("הבוט חי!")
+
 
 # --- החלק החדש עבור ימות המשיח ---
-@app.route('/wakeup')
-def wakeup_from_yemot():
-    # מחזיר פקודה למערכת להקריא טקסט, כדי שלא תשמיע שגיאה
-    return "id_list_message=t-השרת פעיל והקוד עובד"
+class WakeupHandler(RequestHandler):
+    def get(self):
+        # מחזיר פקודה למערכת להקריא טקסט, כדי שלא תשמיע שגיאה
+        self.write("id_list_message=t-השרת פעיל והקוד עובד")
+
+
+# --- בדיקת בריאות ---
+class HealthHandler(RequestHandler):
+    def initialize(self, health):
+        self.health = health
+
+    def get(self):
+        status = self.health() if self.health else {}
+        status.setdefault("status", "ok")
+        self.set_status(200 if status["status"] == "ok" else 503)
+        self.set_header("Content-Type", "application/json")
+        self.write(json.dumps(status, ensure_ascii=False))
+
+
+# --- מדדים בפורמט Prometheus ---
+class MetricsHandler(RequestHandler):
+    def get(self):
+        self.set_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.write(metrics.render())
+
+
+# --- עדכונים מטלגרם (webhook) ---
+class TelegramWebhookHandler(RequestHandler):
+    def initialize(self, bot_app, secret_token):
+        # "application" שמור ב-tornado לאפליקציית ה-HTTP עצמה
+        self.bot_app = bot_app
+        self.secret_token = secret_token
+
+    def post(self):
+        header = self.request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        if self.secret_token and not secrets.compare_digest(header, self.secret_token):
+            logging.warning("⚠️ בקשת webhook עם טוקן סודי שגוי נדחתה.")
+            self.set_status(403)
+            return
+        try:
+            update = Update.de_json(json.loads(self.request.body), self.bot_app.bot)
+        except (ValueError, TypeError) as e:
+            logging.error(f"❌ עדכון לא תקין התקבל ב-webhook: {e}")
+            self.set_status(400)
+            return
+        if update is not None:
+            self.bot_app.update_queue.put_nowait(update)
+
+
+def make_app(application=None, webhook_path=None, secret_token=None, health=None):
+    routes = [
+        (r"/", HomeHandler),
+        (r"/wakeup", WakeupHandler),
+        (r"/healthz", HealthHandler, {"health": health}),
+        (r"/metrics", MetricsHandler),
+    ]
+    if application is not None and webhook_path:
+        routes.append((webhook_path, TelegramWebhookHandler,
+                       {"bot_app": application, "secret_token": secret_token}))
+    return Application(routes)
 
-def run():
-    app.run(host='0.0.0.0', port=8080)
 
-def keep_alive():
-    t = Thread(target=run)
-    t.start()
+def keep_alive(port=8080, application=None, webhook_path=None, secret_token=None, health=None):
+    """מפעיל את השרת בלולאת האירועים הנוכחית ומחזיר אותו (לעצירה ב-stop)"""
+    server = HTTPServer(make_app(application, webhook_path, secret_token, health), xheaders=True)
+    server.listen(port, address="0.0.0.0")
+    logging.info(f"🌐 שרת HTTP מאזין בפורט {port}")
+    return server
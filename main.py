@@ -1,35 +1,76 @@
+import time
+PROCESS_STARTED = time.perf_counter()  # לפני כל הייבואים, למדידת זמן העלייה
 import os
 import json
-import subprocess
-import requests
 import base64
-from datetime import datetime
+import hashlib
+import importlib
+import secrets
+import signal
+import socket
+from datetime import datetime, timedelta, timezone
 from zoneinfo import ZoneInfo
 import asyncio
-import re
-import time
+import tempfile
+import httpx
 from telegram import Update
 from telegram.ext import ApplicationBuilder, ContextTypes, TypeHandler, CommandHandler
-from google.cloud import texttospeech
 import logging
-from difflib import SequenceMatcher  # הוספה: ספרייה לבדיקת דמיון בין טקסטים
-
-# 🔧 הגדרת לוגים
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s | %(levelname)s | %(message)s',
-    handlers=[
-        logging.FileHandler("log.txt"),
-        logging.StreamHandler()
-    ]
+from text_cleaner import TextCleaner
+from channel_queue import ChannelDispatcher
+from media_tools import MediaToolError, ingest_media, run_tool
+from audio import build_wav
+from tts_cache import TTSCache
+from tts import TTSService
+from ymot_uploader import YmotUploader
+from dedup import DuplicateIndex, minhash, shingles
+from storage import StateStore
+from coalescer import BurstCoalescer
+from fanout import RenderCache
+from replicas import LeaderLease, SharedJobQueue
+from job_log import setup_logging, job_context, log_stage, log_event, trace_id
+from metrics import JOB_SECONDS, MESSAGES, QUEUE_DEPTH, SHED, FANOUT_REUSE, STARTUP_SECONDS
+
+STARTUP_SECONDS.set(time.perf_counter() - PROCESS_STARTED, "imports")
+
+# 🔧 הגדרת לוגים: נכתבים ברקע, הקובץ מתחלף לפי גודל (או לפי זמן), ראו job_log.py.
+# כמה עותקים לא יכולים לסובב את אותו קובץ; במצב עותקים בלי LOG_FILE משלו
+# (start.sh נותן log.<n>.txt לכל עותק) הלוג נכתב רק למסוף.
+setup_logging(
+    os.getenv("LOG_FILE") or (None if os.getenv("REPLICA_MODE") == "1" else "log.txt"),
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    file_format=os.getenv("LOG_FORMAT", "text"),
+    max_bytes=int(os.getenv("LOG_MAX_MB", "10")) * 1024 * 1024,
+    backups=int(os.getenv("LOG_BACKUPS", "5")),
+    rotate_when=os.getenv("LOG_ROTATE_WHEN") or None,
 )
 
-# 🔒 מנעול לעיבוד הודעות
-processing_lock = asyncio.Lock()
+# 🚦 תקרה גלובלית לעבודות שרצות במקביל (ערוצים שונים)
+MAX_CONCURRENT_JOBS = int(os.getenv("MAX_CONCURRENT_JOBS", "2"))
 
 # ---------------------------------------------------------
 # ⚙️ הגדרות הערוצים
 # ---------------------------------------------------------
+# ברירות מחדל לכל הערוצים; ערוץ יכול לדרוס כל מפתח בהגדרה שלו.
+# dedup_threshold - סף דמיון (Jaccard על זוגות מילים) לזיהוי הודעה כפולה, None מבטל
+# dedup_window    - כמה הודעות אחרונות נשמרות לבדיקת כפילות
+# coalesce_window    - שניות שקט שאחריהן הודעות טקסט רצופות יוצאות כמבזק אחד, None מבטל
+# coalesce_max_delay - תקרה (שניות) מההודעה הראשונה, כדי שמבזק דחוף לא יחכה
+# fresh_for  - גיל הודעה (שניות מזמן הפרסום) שאחריו מדיה מוקראת רק ככיתוב, בלי הורדה והמרה
+# drop_after - גיל הודעה שאחריו היא כבר לא חדשות ולא מועלית בכלל; None מבטל
+# media_dedup_threshold - סף דמיון טביעת השמע (0.5 = קטעים שונים) לזיהוי הקלטה/וידאו כפולים, None מבטל
+# media_dedup_window    - כמה קטעי מדיה אחרונים נשמרים לבדיקה
+CHANNEL_DEFAULTS = {
+    "dedup_threshold": 0.5,
+    "dedup_window": 2000,
+    "coalesce_window": None,
+    "coalesce_max_delay": 90,
+    "fresh_for": 300,
+    "drop_after": 900,
+    "media_dedup_threshold": 0.6,
+    "media_dedup_window": 300,
+}
+
 CHANNELS_CONFIG = {
     # ערוץ A
     -1003308764465: {  
@@ -63,44 +104,81 @@ CHANNELS_CONFIG = {
     }
 }
 
+# כל ערוץ מקבל את ברירות המחדל, וההגדרות שלו דורסות אותן
+CHANNELS_CONFIG = {chat_id: {**CHANNEL_DEFAULTS, **config} for chat_id, config in CHANNELS_CONFIG.items()}
+
 # ---------------------------------------------------------
 # 🟡 הגדרת Google TTS
 # ---------------------------------------------------------
-key_b64 = os.environ.get("GOOGLE_APPLICATION_CREDENTIALS_B64")
-if not key_b64:
-    logging.warning("⚠️ משתנה GOOGLE_APPLICATION_CREDENTIALS_B64 חסר! הבוט לא יוכל להמיר טקסט לקול.")
-else:
+# המפתח מפוענח בזיכרון ונמסר ישירות ללקוח, בלי לכתוב google_key.json לדיסק
+def load_google_credentials():
+    key_b64 = os.environ.get("GOOGLE_APPLICATION_CREDENTIALS_B64")
+    if not key_b64:
+        if not os.environ.get("GOOGLE_APPLICATION_CREDENTIALS"):
+            logging.warning("⚠️ משתנה GOOGLE_APPLICATION_CREDENTIALS_B64 חסר! הבוט לא יוכל להמיר טקסט לקול.")
+        return None
     try:
-        with open("google_key.json", "wb") as f:
-            f.write(base64.b64decode(key_b64))
-        os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = "google_key.json"
+        return json.loads(base64.b64decode(key_b64))
     except Exception as e:
-        logging.error(f"❌ נכשל בכתיבת קובץ מפתח גוגל: {e}")
+        logging.error(f"❌ נכשל בפענוח מפתח גוגל: {e}")
+        return None
+
+GOOGLE_CREDENTIALS_INFO = load_google_credentials()
 
 # 🛠 משתנים מ־Render
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 YMOT_TOKEN = os.getenv("YMOT_TOKEN")
 
-# קבצי הגדרות
+# 🗄️ מאגר המצב (SQLite). קבצי ה-JSON הישנים מיובאים אליו פעם אחת.
+STATE_DB = os.getenv("STATE_DB", "bot_state.db")
 BLACKLIST_FILE = "blacklist.json"
 REPLACEMENTS_FILE = "replacements.json"
-HISTORY_FILE_A = "history_channel_a.json"  # הוספה: קובץ היסטוריה לערוץ A
+HISTORY_FILE_A = "history_channel_a.json"  # היסטוריה ישנה של ערוץ A
+DEDUP_DIR = "dedup_history"  # היסטוריית כפילויות בקבצי jsonl (לפני המעבר ל-SQLite)
+
+state = StateStore(STATE_DB)
+
+def migrate_legacy_state():
+    if state.get_meta("json_migrated"):
+        return
+    history = {}
+    # היסטוריית טקסטים של ערוץ A -> חתימות
+    if os.path.exists(HISTORY_FILE_A):
+        try:
+            with open(HISTORY_FILE_A, "r", encoding="utf-8") as f:
+                texts = json.load(f)
+            history[-1003308764465] = [sig for sig in (minhash(shingles(t)) for t in texts if isinstance(t, str)) if sig]
+        except (OSError, ValueError) as e:
+            logging.error(f"❌ לא הצלחתי לקרוא את {HISTORY_FILE_A}: {e}")
+    # חתימות שכבר נשמרו בקבצי jsonl לכל ערוץ
+    if os.path.isdir(DEDUP_DIR):
+        for name in os.listdir(DEDUP_DIR):
+            if not name.endswith(".jsonl"):
+                continue
+            try:
+                with open(os.path.join(DEDUP_DIR, name), "r", encoding="utf-8") as f:
+                    history[int(name[:-6])] = [json.loads(line) for line in f if line.strip()]
+            except (OSError, ValueError) as e:
+                logging.error(f"❌ לא הצלחתי לקרוא את {name}: {e}")
+    state.migrate_from_json(BLACKLIST_FILE, REPLACEMENTS_FILE, history)
+
+migrate_legacy_state()
 
 # ---------------------------------------------------------
 # 🛡️ ניהול רשימות (Blacklist & Replacements)
 # ---------------------------------------------------------
-def load_json_file(filename):
-    if not os.path.exists(filename):
-        return {} if filename == REPLACEMENTS_FILE else []
-    try:
-        with open(filename, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except:
-        return {} if filename == REPLACEMENTS_FILE else []
+# מנוע הניקוי נבנה פעם אחת ונבנה מחדש רק אחרי שינוי ברשימות
+_text_cleaner = None
+
+def get_text_cleaner():
+    global _text_cleaner
+    if _text_cleaner is None:
+        _text_cleaner = TextCleaner(state.get_replacements(), state.get_blacklist())
+    return _text_cleaner
 
-def save_json_file(filename, data):
-    with open(filename, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+def invalidate_text_cleaner():
+    global _text_cleaner
+    _text_cleaner = None
 
 # --- פקודות לרשימה שחורה ---
 async def add_word(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -108,10 +186,8 @@ async def add_word(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("usage: /addword [word]")
         return
     word = " ".join(context.args)
-    words = load_json_file(BLACKLIST_FILE)
-    if word not in words:
-        words.append(word)
-        save_json_file(BLACKLIST_FILE, words)
+    if state.add_word(word):
+        invalidate_text_cleaner()
         await update.message.reply_text(f"המילה '{word}' נוספה לרשימה השחורה.")
     else:
         await update.message.reply_text("המילה כבר קיימת ברשימה.")
@@ -121,16 +197,14 @@ async def del_word(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("usage: /delword [word]")
         return
     word = " ".join(context.args)
-    words = load_json_file(BLACKLIST_FILE)
-    if word in words:
-        words.remove(word)
-        save_json_file(BLACKLIST_FILE, words)
+    if state.remove_word(word):
+        invalidate_text_cleaner()
         await update.message.reply_text(f"המילה '{word}' הוסרה מהרשימה.")
     else:
         await update.message.reply_text("המילה לא נמצאה ברשימה.")
 
 async def list_words(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    words = load_json_file(BLACKLIST_FILE)
+    words = state.get_blacklist()
     if not words:
         await update.message.reply_text("הרשימה ריקה.")
     else:
@@ -147,9 +221,8 @@ async def add_replace(update: Update, context: ContextTypes.DEFAULT_TYPE):
     source = context.args[0]
     target = " ".join(context.args[1:])
     
-    replacements = load_json_file(REPLACEMENTS_FILE)
-    replacements[source] = target
-    save_json_file(REPLACEMENTS_FILE, replacements)
+    state.set_replacement(source, target)
+    invalidate_text_cleaner()
     
     await update.message.reply_text(f"הוגדרה החלפה: '{source}' -> '{target}'")
 
@@ -159,17 +232,15 @@ async def del_replace(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     source = context.args[0]
-    replacements = load_json_file(REPLACEMENTS_FILE)
     
-    if source in replacements:
-        del replacements[source]
-        save_json_file(REPLACEMENTS_FILE, replacements)
+    if state.remove_replacement(source):
+        invalidate_text_cleaner()
         await update.message.reply_text(f"ההחלפה עבור '{source}' נמחקה.")
     else:
         await update.message.reply_text(f"לא נמצאה החלפה עבור '{source}'.")
 
 async def list_replace(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    replacements = load_json_file(REPLACEMENTS_FILE)
+    replacements = state.get_replacements()
     if not replacements:
         await update.message.reply_text("רשימת ההחלפות ריקה.")
     else:
@@ -183,84 +254,8 @@ async def list_replace(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # ---------------------------------------------------------
 def clean_text(text):
     if not text: return ""
-    
-    # 1. ביצוע החלפות מילים (לפי הקובץ החדש)
-    replacements = load_json_file(REPLACEMENTS_FILE)
-    # ממיינים מהארוך לקצר כדי למנוע החלפות חלקיות שגויות
-    sorted_keys = sorted(replacements.keys(), key=len, reverse=True)
-    
-    for src in sorted_keys:
-        target = replacements[src]
-        # החלפה פשוטה (case sensitive פחות קריטי בעברית, אבל נשאיר ככה)
-        text = text.replace(src, target)
-
-    # 2. ניקוי לפי רשימה שחורה דינמית
-    blocked_words = load_json_file(BLACKLIST_FILE)
-    for word in blocked_words:
-        text = text.replace(word, '')
-
-    # 3. ניקוי קבוע של קישורים ומספרים
-    text = re.sub(r'https?://\S+', '', text)
-    text = re.sub(r'www\.\S+', '', text)
-    text = re.sub(r'chat\.whatsapp\.com\S*', '', text)
-    text = re.sub(r'wa\.me\S*', '', text)
-    text = re.sub(r't\.me\S*', '', text)
-    text = re.sub(r'[a-zA-Z0-9-]+\.(com|co\.il|net|org|me)\S*', '', text)
-    text = re.sub(r'@\S+', '', text)
-    text = re.sub(r'\d{2,3}[-\s]?\d{3}[-\s]?\d{4}', '', text)
-    text = re.sub(r'[^\w\s.,!?()\u0590-\u05FF]', '', text)
-    text = re.sub(r'\s+', ' ', text).strip()
-    
-    return text
-
-def has_audio_stream(file_path):
-    """בודק האם יש ערוץ שמע, והאם הוא מכיל סאונד בעוצמה מינימלית"""
-    try:
-        # שלב 1: בדיקה טכנית לקיום ערוץ שמע
-        cmd_streams = [
-            "ffprobe", 
-            "-v", "error", 
-            "-select_streams", "a", 
-            "-show_entries", "stream=codec_name", 
-            "-of", "default=noprint_wrappers=1:nokey=1", 
-            file_path
-        ]
-        result = subprocess.run(cmd_streams, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        
-        if not result.stdout.strip():
-            logging.info("🔇 FFprobe: לא נמצא ערוץ שמע (Stream) בקובץ.")
-            return False
-
-        # שלב 2: בדיקת עוצמת שמע (Volume Detection)
-        cmd_vol = [
-            "ffmpeg",
-            "-t", "20", 
-            "-i", file_path,
-            "-af", "volumedetect",
-            "-vn", "-sn", "-dn", 
-            "-f", "null", 
-            "/dev/null"
-        ]
-        
-        result_vol = subprocess.run(cmd_vol, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        output = result_vol.stderr
-        
-        match = re.search(r"max_volume: ([\-\d\.]+) dB", output)
-        if match:
-            max_vol = float(match.group(1))
-            logging.info(f"🔊 עוצמת שמע מקסימלית זוהתה: {max_vol} dB")
-            
-            if max_vol < -50.0:
-                logging.info("🔇 עוצמת השמע נמוכה מדי (שקט), מדלג.")
-                return False
-            return True
-        else:
-            logging.warning("⚠️ לא הצלחתי לזהות עוצמת שמע, מניח שיש שמע.")
-            return True 
-            
-    except Exception as e:
-        logging.error(f"❌ שגיאה בבדיקת שמע: {e}")
-        return False
+    # החלפות, רשימה שחורה וניקוי קישורים/טלפונים - במעבר אחד (ראו text_cleaner.py)
+    return get_text_cleaner().clean(text)
 
 # 🔢 המרת מספרים לעברית
 def num_to_hebrew_words(hour, minute):
@@ -294,228 +289,637 @@ def num_to_hebrew_words(hour, minute):
         
     return f"{hours_map[hour_12]} {min_text}"
 
-# 🎤 יצירת MP3
-def text_to_mp3(text, filename='output.mp3'):
-    if not text: return False
-    try:
-        client = texttospeech.TextToSpeechClient()
-        synthesis_input = texttospeech.SynthesisInput(text=text)
-        voice = texttospeech.VoiceSelectionParams(language_code="he-IL", name="he-IL-Wavenet-B", ssml_gender=texttospeech.SsmlVoiceGender.MALE)
-        audio_config = texttospeech.AudioConfig(audio_encoding=texttospeech.AudioEncoding.MP3, speaking_rate=1.2)
-        response = client.synthesize_speech(input=synthesis_input, voice=voice, audio_config=audio_config)
-        with open(filename, "wb") as out:
-            out.write(response.audio_content)
-        return True
-    except Exception as e:
-        logging.error(f"שגיאה ביצירת TTS: {e}")
-        return False
-
-# 🎧 המרה ל־WAV
-def convert_to_wav(input_file, output_file='output.wav'):
-    subprocess.run(['ffmpeg', '-i', input_file, '-ar', '8000', '-ac', '1', '-f', 'wav', output_file, '-y'], stderr=subprocess.DEVNULL)
-
-# 🔗 חיבור קבצים
-def concat_wav_files(file_list, output_file="merged.wav"):
-    valid_files = [f for f in file_list if os.path.exists(f)]
-    if not valid_files:
-        return False
-    
-    list_filename = "list.txt"
-    with open(list_filename, "w", encoding="utf-8") as f:
-        for file_path in valid_files:
-            f.write(f"file '{file_path}'\n")
-    
-    subprocess.run([
-        "ffmpeg", "-y", "-f", "concat", "-safe", "0",
-        "-i", list_filename, "-c", "copy", output_file
-    ], stderr=subprocess.DEVNULL)
-    
-    os.remove(list_filename)
-    return True
+def build_intro_text(intro_suffix, hour, minute):
+    return f"{num_to_hebrew_words(hour, minute)} {intro_suffix}"
+
+def intro_text_at(intro_suffix, when):
+    """פתיח לפי שעת הפרסום של ההודעה (ולא לפי שעת העיבוד)"""
+    if not intro_suffix:
+        return ""
+    local = (when or datetime.now(timezone.utc)).astimezone(ZoneInfo('Asia/Jerusalem'))
+    return build_intro_text(intro_suffix, local.hour, local.minute)
+
+# 🎤 יצירת שמע: Google מחזיר ישירות 8kHz מונו LINEAR16, כך שאין צורך בהמרה
+tts_cache = TTSCache(
+    os.getenv("TTS_CACHE_DIR", "tts_cache"),
+    max_disk_bytes=int(os.getenv("TTS_CACHE_DISK_MB", "200")) * 1024 * 1024,
+    max_memory_bytes=int(os.getenv("TTS_CACHE_MEMORY_MB", "32")) * 1024 * 1024,
+)
+
+# לקוח TTS קבוע לכל חיי הבוט (נוצר ב-on_startup)
+tts = TTSService(
+    tts_cache,
+    pool_size=int(os.getenv("TTS_CLIENT_POOL", "1")),
+    timeout=float(os.getenv("TTS_TIMEOUT", "15")),
+    deadline=float(os.getenv("TTS_DEADLINE", "30")),
+    chunk_bytes=int(os.getenv("TTS_CHUNK_BYTES", "1500")),
+    fanout=int(os.getenv("TTS_FANOUT", "4")),
+    credentials_info=GOOGLE_CREDENTIALS_INFO,
+)
+
+# 🎧 הורדת מדיה מטלגרם בזרימה ישירות ל-ffmpeg (בלי קובץ ביניים)
+download_client = httpx.AsyncClient(timeout=httpx.Timeout(60.0, connect=10.0))
+
+async def telegram_file_chunks(tg_file):
+    if tg_file.file_path and tg_file.file_path.startswith("http"):
+        async with download_client.stream("GET", tg_file.file_path) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes():
+                yield chunk
+    else:
+        # שרת Bot API מקומי מחזיר נתיב קובץ ולא כתובת
+        yield bytes(await tg_file.download_as_bytearray())
+
+# ♻️ אותו קובץ (file_unique_id זהה) שמגיע לכמה ערוצים מורד וממומר פעם אחת.
+# גם ההקראה משותפת: פתיח וגוף זהים נוצרים פעם אחת בתוך TTSService.
+FANOUT_WINDOW = float(os.getenv("FANOUT_WINDOW", "180"))
+media_renders = RenderCache(
+    window=FANOUT_WINDOW,
+    max_items=int(os.getenv("FANOUT_MAX_ITEMS", "16")),
+    # PCM מפוענח תופס כמגה לדקת שמע; התקרה היא על סך הבתים במטמון
+    max_bytes=int(os.getenv("FANOUT_MAX_MB", "64")) * 1024 * 1024,
+    size=lambda result: len(result.pcm or b""),
+    on_reuse=lambda key: FANOUT_REUSE.inc("media"),
+)
 
-# 📤 העלאה לימות
-def upload_to_ymot(wav_file_path, target_path):
-    url = 'https://call2all.co.il/ym/api/UploadFile'
+async def ingest_telegram_media(media_obj, fallback_path):
+    """מחזיר IngestResult, או None אם ההורדה/ההמרה נכשלו (ואז לא מעלים כלום)"""
+    return await media_renders.get_or_render(
+        media_obj.file_unique_id, lambda: ingest_telegram_media_once(media_obj, fallback_path))
+
+async def ingest_telegram_media_once(media_obj, fallback_path):
     try:
-        with open(wav_file_path, 'rb') as f:
-            files = {'file': (os.path.basename(wav_file_path), f, 'audio/wav')}
-            data = {'token': YMOT_TOKEN, 'path': target_path, 'convertAudio': '1', 'autoNumbering': 'true'}
-            response = requests.post(url, data=data, files=files)
-            logging.info(f"📞 הועלה ל-{target_path}: {response.text}")
-    except Exception as e:
-        logging.error(f"❌ שגיאה בהעלאה לימות: {e}")
+        with log_stage("ingest", file=media_obj.file_unique_id) as fields:
+            tg_file = await media_obj.get_file()
+            result = await ingest_media(telegram_file_chunks(tg_file), fallback_path)
+            fields["bytes"] = len(result.pcm or b"")
+            return result
+    except (MediaToolError, httpx.HTTPError) as e:
+        logging.error(f"❌ קליטת המדיה נכשלה: {e}")
+        return None
+
+# 🚫 אינדקס כפילויות לכל ערוץ (נטען ממאגר המצב בפעם הראשונה שצריך)
+dedup_indexes = {}
+
+def get_dedup_index(chat_id):
+    config = CHANNELS_CONFIG[chat_id]
+    if not config.get("dedup_threshold"):
+        return None
+    index = dedup_indexes.get(chat_id)
+    if index is None:
+        index = dedup_indexes[chat_id] = DuplicateIndex(
+            threshold=config["dedup_threshold"],
+            window=config.get("dedup_window", 2000),
+            store=state,
+            chat_id=chat_id
+        )
+    return index
+
+# 🎼 אינדקס כפילויות מדיה לכל ערוץ (file_unique_id + טביעת שמע, ראו audio_fingerprint.py)
+media_indexes = {}
+
+def get_media_index(chat_id):
+    config = CHANNELS_CONFIG[chat_id]
+    if not config.get("media_dedup_threshold"):
+        return None
+    index = media_indexes.get(chat_id)
+    if index is None:
+        # NumPy נטען רק כשצריך, כדי לא להאט את עליית הבוט
+        from audio_fingerprint import MediaDuplicateIndex
+        index = media_indexes[chat_id] = MediaDuplicateIndex(
+            threshold=config["media_dedup_threshold"],
+            window=config.get("media_dedup_window", 300),
+            store=state,
+            chat_id=chat_id
+        )
+    return index
+
+# 📤 העלאה לימות: הקובץ נכנס לתור ההעלאות ברקע, והעבודה ממשיכה להודעה הבאה
+uploader = YmotUploader(
+    YMOT_TOKEN,
+    max_attempts=int(os.getenv("YMOT_UPLOAD_ATTEMPTS", "4")),
+    connect_timeout=float(os.getenv("YMOT_CONNECT_TIMEOUT", "10")),
+    read_timeout=float(os.getenv("YMOT_READ_TIMEOUT", "60")),
+    max_connections=int(os.getenv("YMOT_MAX_CONNECTIONS", "4")),
+    # קבצים גדולים מהסף עולים בחלקים, כל חלק עם ניסיונות חוזרים משלו
+    chunk_threshold=int(os.getenv("YMOT_CHUNK_THRESHOLD_KB", "4096")) * 1024,
+    chunk_size=int(os.getenv("YMOT_CHUNK_SIZE_KB", "1024")) * 1024,
+    chunk_parallelism=int(os.getenv("YMOT_CHUNK_PARALLEL", "3")),
+)
+
+def upload_to_ymot(wav_data, target_path, filename="upload.wav"):
+    return uploader.enqueue(wav_data, target_path, filename)
+
+# 🧺 איחוד פרצי הודעות טקסט למבזק אחד עם פתיח אחד (לפי coalesce_window)
+coalescers = {}
+
+def get_coalescer(chat_id):
+    config = CHANNELS_CONFIG[chat_id]
+    if not config.get("coalesce_window"):
+        return None
+    coalescer = coalescers.get(chat_id)
+    if coalescer is None:
+        coalescer = coalescers[chat_id] = BurstCoalescer(
+            lambda items: synthesize_bulletin(chat_id, items),
+            window=config["coalesce_window"],
+            max_delay=config.get("coalesce_max_delay") or config["coalesce_window"],
+            name=str(chat_id)
+        )
+    return coalescer
+
+def join_bulletin(texts):
+    # כל הודעה מסתיימת בסוף משפט, כדי שהחיתוך לקטעים וההקראה יפרידו ביניהן
+    return " ".join(t if t[-1] in ".!?" else f"{t}." for t in texts)
+
+async def synthesize_bulletin(chat_id, items):
+    """מקריא כמה הודעות טקסט, [(טקסט, זמן פרסום, מזהה מעקב)], כמבזק אחד ומחזיר את ה-Future של ההעלאה (או None)"""
+    config = CHANNELS_CONFIG[chat_id]
+    texts = [text for text, _, _ in items]
+    # הפתיח לפי ההודעה האחרונה שנכנסה למבזק
+    posted_at = max(date for _, date, _ in items)
+    # המבזק נרשם בלוג תחת המזהה של ההודעה הראשונה, עם המזהים של כולן
+    with job_context(items[0][2], chat_id):
+        log_event(f"🧺 מבזק מאוחד מ-{len(texts)} הודעות בערוץ {chat_id}", traces=",".join(t for _, _, t in items))
+        with log_stage("tts") as fields:
+            intro_pcm, text_pcm = await asyncio.gather(
+                tts.synthesize(intro_text_at(config["intro_suffix"], posted_at)),
+                tts.synthesize_long(join_bulletin(texts)),
+            )
+            fields["bytes"] = len(intro_pcm or b"") + len(text_pcm or b"")
+        if not text_pcm:
+            return None
+        with log_stage("assemble") as fields:
+            wav_data = build_wav([pcm for pcm in (intro_pcm, text_pcm) if pcm])
+            fields["bytes"] = len(wav_data)
+        filename = "final_upload.wav" if config["merge_text"] else "text_upload.wav"
+        return upload_to_ymot(wav_data, config["path"], filename)
 
 # 📥 טיפול בהודעה
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    async with processing_lock:
-        message = update.message or update.channel_post
-        if not message: return
-
-        chat_id = message.chat.id
-        logging.info(f"📢 התקבלה הודעה מערוץ: {chat_id}")
+    message = update.message or update.channel_post
+    if not message: return
 
-        if chat_id not in CHANNELS_CONFIG:
-            logging.info(f"⚠️ ערוץ {chat_id} לא מוגדר בקונפיגורציה. מתעלם.")
-            return
+    chat_id = message.chat.id
+    logging.info(f"📢 התקבלה הודעה מערוץ: {chat_id}")
 
-        config = CHANNELS_CONFIG[chat_id]
-        target_path = config["path"]
-        intro_suffix = config["intro_suffix"]
-        should_merge = config["merge_text"]
+    if chat_id not in CHANNELS_CONFIG:
+        logging.info(f"⚠️ ערוץ {chat_id} לא מוגדר בקונפיגורציה. מתעלם.")
+        return
 
-        text_content = message.text or message.caption or ""
-        text_content = clean_text(text_content)
+    if REPLICA_MODE:
+        # העדכון נשמר בתור המשותף, וכל אחד מהעותקים יכול לעבד אותו
+        job_id = state.create_job(chat_id, message.message_id, priority=job_priority(message), payload=update.to_json())
+        with job_context(job_trace(job_id), chat_id):
+            log_event("📥 הודעה נכנסה לתור המשותף", message_id=message.message_id, priority=job_priority(message))
+        shared_jobs.notify()
+        return
 
-        # ---------------------------------------------------------------------
-        # הוספה: מנגנון בדיקת כפילות לערוץ A (לפי מילים, סף 60%, היסטוריה 60)
-        # ---------------------------------------------------------------------
-        if chat_id == -1003308764465 and text_content:  # בדיקה רק לערוץ A ורק אם יש טקסט
-            history = load_json_file(HISTORY_FILE_A)
-            if not isinstance(history, list):
-                history = []
-            
-            new_words = text_content.split()
-            is_duplicate = False
-            
-            # בדיקה רק אם יש מילים להשוות
-            if new_words:
-                for old_text in history:
-                    old_words = old_text.split()
-                    # חישוב דמיון (בין 0 ל-1) לפי רצף מילים
-                    similarity = SequenceMatcher(None, new_words, old_words).ratio()
-                    
-                    if similarity > 0.6:  # אם הדמיון גבוה מ-60%
-                        logging.info(f"🚫 זוהתה הודעה כפולה בערוץ A (דמיון: {similarity:.2f}). מדלג על ההעלאה.")
-                        is_duplicate = True
-                        break
-            
-            if is_duplicate:
-                return  # עצור כאן ואל תמשיך לטיפול בהודעה
-            
-            # אם לא כפול, הוסף להיסטוריה ושמור
-            history.append(text_content)
-            # הגבלה ל-60 הודעות אחרונות
-            if len(history) > 60:
-                history = history[-60:]
-            save_json_file(HISTORY_FILE_A, history)
-        # ---------------------------------------------------------------------
-
-        video_file_path = None
-        audio_file_path = None
-        
-        # 1. עיבוד מדיה (וידאו/אודיו)
-        if message.video or message.animation: 
-            media_obj = message.video or message.animation
-            is_animation = message.animation is not None
-            
-            video_file = await media_obj.get_file()
-            video_file_path = "temp_video.mp4"
-            await video_file.download_to_drive(video_file_path)
-            
-            # בדיקת שמע משודרגת
-            has_audio = has_audio_stream(video_file_path)
-            
-            if is_animation:
-                 logging.info("🔇 זוהה קובץ אנימציה (GIF). נחשב כחסר שמע.")
-                 has_audio = False 
-
-            if not has_audio:
-                logging.info("🔇 וידאו ללא שמע זוהה. מדלג על ההעלאה.")
-                if os.path.exists(video_file_path):
-                    os.remove(video_file_path)
-                return 
-            
-            convert_to_wav(video_file_path, "media_raw.wav")
-            audio_file_path = "media_raw.wav"
-            if os.path.exists(video_file_path):
-                os.remove(video_file_path)
-
-        elif message.audio or message.voice:
-            audio_obj = await (message.audio or message.voice).get_file()
-            orig_path = "temp_audio.ogg"
-            await audio_obj.download_to_drive(orig_path)
-            convert_to_wav(orig_path, "media_raw.wav")
-            audio_file_path = "media_raw.wav"
-            if os.path.exists(orig_path):
-                os.remove(orig_path)
-
-        # 2. הכנת טקסטים (פתיח + גוף)
-        files_to_merge = []
-        
-        need_intro = False
-        if text_content: 
-            need_intro = True 
-        
-        full_intro_text = ""
-        if intro_suffix and need_intro:
-            tz = ZoneInfo('Asia/Jerusalem')
-            now = datetime.now(tz)
-            hebrew_time_str = num_to_hebrew_words(now.hour, now.minute)
-            full_intro_text = f"{hebrew_time_str} {intro_suffix}"
-
-        text_wav_path = None
-
-        # --- חיבור הטקסטים לפני המרה לקול ---
-        if should_merge and full_intro_text and text_content:
-            combined_text = f"{full_intro_text} {text_content}"
-            if text_to_mp3(combined_text, "combined.mp3"):
-                convert_to_wav("combined.mp3", "combined.wav")
-                text_wav_path = "combined.wav"
-        
+    # העיבוד עצמו רץ בתור של הערוץ, כך שערוץ איטי לא מעכב ערוצים אחרים.
+    # מספר העבודה הוא גם מזהה המעקב שלה בלוגים, והתור מעביר אותו הלאה.
+    job_id = state.create_job(chat_id, message.message_id)
+    with job_context(job_trace(job_id), chat_id):
+        log_event("📥 הודעה נכנסה לתור", message_id=message.message_id, priority=job_priority(message))
+        dispatcher.submit(chat_id, (job_id, message, time.perf_counter()), priority=job_priority(message))
+
+def job_trace(job_id):
+    return f"j{job_id}"
+
+# ⏫ עדיפויות: טקסט (והודעות שמדלגים עליהן מהר) לפני מדיה שצריך להוריד ולהמיר
+PRIORITY_TEXT = 0
+PRIORITY_MEDIA = 1
+
+def job_priority(message):
+    if message.video or message.audio or message.voice:
+        return PRIORITY_MEDIA
+    return PRIORITY_TEXT
+
+def freshness(message, config):
+    """מחזיר fresh/downgrade/drop לפי גיל ההודעה מזמן הפרסום שלה"""
+    if message.date is None:
+        return "fresh"
+    age = (datetime.now(timezone.utc) - message.date).total_seconds()
+    if config.get("drop_after") and age > config["drop_after"]:
+        return "drop"
+    if config.get("fresh_for") and age > config["fresh_for"] and job_priority(message) == PRIORITY_MEDIA:
+        return "downgrade"
+    return "fresh"
+
+async def process_message(job):
+    job_id, message, received_at = job
+    chat_id = message.chat.id
+    state.update_job(job_id, "processing")
+    outcome = "failed"
+    uploads = []
+    try:
+        verdict = freshness(message, CHANNELS_CONFIG[chat_id])
+        if verdict == "drop":
+            logging.info(f"⌛ הודעה {message.message_id} מערוץ {chat_id} ישנה מדי ({message.date:%H:%M}). מדלג.")
+            SHED.inc(str(chat_id), "dropped")
+            outcome = "stale"
+            return
+        if verdict == "downgrade":
+            logging.info(f"⌛ הודעה {message.message_id} מערוץ {chat_id} התעכבה, מוקראת בלי המדיה.")
+            SHED.inc(str(chat_id), "downgraded")
+        # לכל עבודה תיקייה זמנית משלה, כך שעבודות מקבילות לא דורסות זו את קבצי זו
+        with tempfile.TemporaryDirectory(prefix="job_") as workspace:
+            outcome = await process_message_in(message, workspace, uploads, text_only=verdict == "downgrade")
+    finally:
+        if uploads:
+            # התוצאה הסופית נקבעת כשכל ההעלאות שברקע מסתיימות
+            state.update_job(job_id, "uploading")
+            asyncio.gather(*uploads, return_exceptions=True).add_done_callback(
+                lambda f: finish_job(job_id, chat_id, received_at, upload_outcome(f)))
         else:
-            if full_intro_text:
-                if text_to_mp3(full_intro_text, "intro.mp3"):
-                    convert_to_wav("intro.mp3", "intro.wav")
-                    files_to_merge.append("intro.wav")
-            
-            if text_content:
-                if text_to_mp3(text_content, "body.mp3"):
-                    convert_to_wav("body.mp3", "body.wav")
-                    text_wav_path = "body.wav"
-
-        # 3. העלאה
-        if should_merge:
-            if text_wav_path:
-                files_to_merge.append(text_wav_path)
-            if audio_file_path:
-                files_to_merge.append(audio_file_path)
-            
-            if files_to_merge:
-                concat_wav_files(files_to_merge, "final_upload.wav")
-                upload_to_ymot("final_upload.wav", target_path)
+            finish_job(job_id, chat_id, received_at, outcome)
+
+async def process_queued_job(job_id, payload, created_at):
+    """עבודה מהתור המשותף (מצב כמה עותקים)"""
+    update = Update.de_json(json.loads(payload), telegram_app.bot)
+    message = update.message or update.channel_post
+    # ייתכן שעותק אחר עיבד את ההודעה הקודמת בערוץ או שינה את הרשימות
+    if state.refresh_lists():
+        invalidate_text_cleaner()
+    for index in (dedup_indexes.get(message.chat.id), media_indexes.get(message.chat.id)):
+        if index is not None:
+            index.refresh()
+    received_at = time.perf_counter() - max(0.0, time.time() - created_at)
+    with job_context(job_trace(job_id), message.chat.id):
+        log_event(f"👷 העבודה נתפסה ע\"י {REPLICA_ID}", message_id=message.message_id)
+        await process_message((job_id, message, received_at))
+
+def upload_outcome(gathered):
+    if gathered.cancelled():
+        return "failed"
+    return "failed" if any(isinstance(r, BaseException) for r in gathered.result()) else "uploaded"
+
+def finish_job(job_id, chat_id, received_at, outcome):
+    state.update_job(job_id, outcome)
+    duration = time.perf_counter() - received_at
+    MESSAGES.inc(str(chat_id), outcome)
+    JOB_SECONDS.observe(duration, str(chat_id))
+    log_event(f"🏁 העבודה הסתיימה: {outcome}", outcome=outcome, duration=round(duration, 3))
+
+async def process_message_in(message, workspace, uploads, text_only=False):
+    """מעבד הודעה; העלאות שנשלחו לתור נוספות ל-uploads.
+    text_only: רק הטקסט/הכיתוב מוקרא, המדיה לא מורדת.
+    מחזיר את תוצאת העבודה: uploading/duplicate/silent/stale/empty/failed"""
+    def job_file(name):
+        return os.path.join(workspace, name)
+
+    chat_id = message.chat.id
+    config = CHANNELS_CONFIG[chat_id]
+    target_path = config["path"]
+    intro_suffix = config["intro_suffix"]
+    should_merge = config["merge_text"]
+
+    text_content = message.text or message.caption or ""
+    with log_stage("clean", chars=len(text_content)) as fields:
+        text_content = clean_text(text_content)
+        fields["cleaned"] = len(text_content)
+
+    # בדיקת כפילות מול ההיסטוריה של הערוץ (MinHash/LSH, ראו dedup.py)
+    index = get_dedup_index(chat_id)
+    if index is not None and text_content:
+        with log_stage("dedup", kind="text") as fields:
+            is_duplicate, score = index.check_and_add(text_content)
+            fields["score"] = round(score, 3)
+        if is_duplicate:
+            logging.info(f"🚫 זוהתה הודעה כפולה בערוץ {chat_id} (דמיון: {score:.2f}). מדלג על ההעלאה.")
+            return "duplicate"  # עצור כאן ואל תמשיך לטיפול בהודעה
+
+    media_pcm = None
+    has_media = bool(message.video or message.audio or message.voice) and not text_only
+    if text_only and not text_content:
+        # מדיה שהתעכבה ואין לה כיתוב: אין מה להקריא
+        return "stale"
+    
+    # 1. עיבוד מדיה (וידאו/אודיו): הורדה, בדיקת שמע והמרה במעבר ffmpeg אחד
+    if message.animation:
+        logging.info("🔇 זוהה קובץ אנימציה (GIF). נחשב כחסר שמע, מדלג על ההעלאה.")
+        return "silent"
+
+    media_obj = message.video or message.audio or message.voice
+    media_index = get_media_index(chat_id) if has_media else None
+    if media_index is not None and media_index.seen_file(media_obj.file_unique_id):
+        # אותו קובץ בדיוק כבר עלה בערוץ: בלי הורדה ובלי המרה
+        logging.info(f"🚫 קובץ המדיה כבר הועלה בערוץ {chat_id}. מדלג עליו.")
+        has_media = False
+        if not text_content:
+            return "duplicate"
+
+    coalescer = get_coalescer(chat_id)
+    if coalescer is not None:
+        if text_content and not has_media:
+            # הודעת טקסט נכנסת למבזק הפתוח של הערוץ; התוצאה נקבעת כשהוא יועלה
+            uploads.append(coalescer.add((text_content, message.date, trace_id.get())))
+            return "uploading"
+        # מדיה לא נאספת: קודם שולחים את מה שנאסף, כדי שהסדר בשלוחה יישמר
+        await coalescer.flush()
+
+    if has_media and message.video:
+        ingest = await ingest_telegram_media(message.video, job_file("temp_video.mp4"))
+        if ingest is None:
+            return "failed"
+        if not ingest.has_audio:
+            logging.info("🔇 FFmpeg: לא נמצא ערוץ שמע (Stream) בקובץ. מדלג על ההעלאה.")
+            return "silent"
+        logging.info(f"🔊 עוצמת שמע: שיא {ingest.peak_db:.1f} dB, RMS {ingest.rms_db:.1f} dB")
+        if ingest.is_silent:
+            logging.info("🔇 עוצמת השמע נמוכה מדי (שקט). מדלג על ההעלאה.")
+            return "silent"
+        media_pcm = ingest.pcm
+
+    elif has_media:
+        ingest = await ingest_telegram_media(message.audio or message.voice, job_file("temp_audio.ogg"))
+        if ingest is None or not ingest.pcm:
+            return "failed"
+        media_pcm = ingest.pcm
+
+    if media_pcm and media_index is not None:
+        # עותק שקודד מחדש: מזהה שונה, אבל טביעת שמע דומה
+        with log_stage("dedup", kind="media") as fields:
+            # הטביעה והחיפוש (NumPy) רצים בת'רד, כדי לא לעצור את שאר הערוצים
+            fp, score = await asyncio.to_thread(media_index.match, media_pcm)
+            is_duplicate, score = media_index.record(media_obj.file_unique_id, fp, score)
+            fields["score"] = round(score, 3)
+        if is_duplicate:
+            logging.info(f"🚫 זוהתה מדיה כפולה בערוץ {chat_id} (דמיון: {score:.2f}). מדלג עליה.")
+            media_pcm = None
+            if not text_content:
+                return "duplicate"
+
+    # 2. הכנת טקסטים (פתיח + גוף)
+    need_intro = False
+    if text_content: 
+        need_intro = True 
+    
+    full_intro_text = ""
+    if need_intro:
+        full_intro_text = intro_text_at(intro_suffix, message.date)
+
+    # הפתיח נוצר בנפרד מהגוף, כדי שיגיע מהמטמון ויחובר לפני הגוף.
+    # גם במצב איחוד הגוף נחתך לקטעים בלי הפתיח, והכל יוצא לגוגל במקביל.
+    with log_stage("tts", chars=len(full_intro_text) + len(text_content)) as fields:
+        intro_pcm, text_pcm = await asyncio.gather(
+            tts.synthesize(full_intro_text),
+            tts.synthesize_long(text_content),
+        )
+        fields["bytes"] = len(intro_pcm or b"") + len(text_pcm or b"")
+
+    # 3. העלאה: הרכבת ה-WAV הסופי בזיכרון
+    if should_merge:
+        parts = [pcm for pcm in (intro_pcm, text_pcm, media_pcm) if pcm]
+        if parts:
+            with log_stage("assemble") as fields:
+                wav_data = build_wav(parts)
+                fields["bytes"] = len(wav_data)
+            uploads.append(upload_to_ymot(wav_data, target_path, "final_upload.wav"))
+    
+    else:
+        if media_pcm:
+            with log_stage("assemble") as fields:
+                wav_data = build_wav([media_pcm])
+                fields["bytes"] = len(wav_data)
+            uploads.append(upload_to_ymot(wav_data, target_path, "media_raw.wav"))
         
-        else:
-            if audio_file_path:
-                upload_to_ymot(audio_file_path, target_path)
-            
-            text_files_for_upload = []
-            if "intro.wav" in files_to_merge: text_files_for_upload.append("intro.wav")
-            if text_wav_path: text_files_for_upload.append(text_wav_path)
-            
-            if text_files_for_upload:
-                concat_wav_files(text_files_for_upload, "text_upload.wav")
-                upload_to_ymot("text_upload.wav", target_path)
-
-        # 🧹 ניקוי
-        for f in ["intro.mp3", "intro.wav", "body.mp3", "body.wav", "combined.mp3", "combined.wav",
-                  "media_raw.wav", "final_upload.wav", "text_upload.wav", "temp_video.mp4", "temp_audio.ogg"]:
-            if os.path.exists(f):
-                try: os.remove(f)
-                except: pass
+        text_parts = [pcm for pcm in (intro_pcm, text_pcm) if pcm]
+        if text_parts:
+            with log_stage("assemble") as fields:
+                wav_data = build_wav(text_parts)
+                fields["bytes"] = len(wav_data)
+            uploads.append(upload_to_ymot(wav_data, target_path, "text_upload.wav"))
+
+    # 🧹 ניקוי: התיקייה הזמנית של העבודה נמחקת כולה ב-process_message
+    if uploads:
+        return "uploading"
+    return "failed" if text_content or media_pcm else "empty"
+
+# 🔥 חימום מטמון הפתיחים: כל 720 השעות האפשריות לכל סיומת פתיח
+async def warm_intro_bank(context: ContextTypes.DEFAULT_TYPE):
+    suffixes = sorted({c["intro_suffix"] for c in CHANNELS_CONFIG.values() if c["intro_suffix"]})
+    now = datetime.now(ZoneInfo('Asia/Jerusalem'))
+    start = (now.hour % 12) * 60 + now.minute
+    created = 0
+    # מתחילים מהדקות הקרובות, כדי שהפתיחים הדחופים יהיו מוכנים ראשונים
+    for offset in range(12 * 60):
+        hour, minute = divmod((start + offset) % (12 * 60), 60)
+        for suffix in suffixes:
+            text = build_intro_text(suffix, hour, minute)
+            if tts.key(text) in tts_cache:
+                continue
+            if await tts.synthesize(text):
+                created += 1
+    logging.info(f"🔥 חימום פתיחים הסתיים, נוצרו {created} קטעים חדשים.")
+
+# 🌡️ חימום אחרי עלייה: הבוט כבר מקבל הודעות, והחימום רץ ברקע כדי
+# שהמבזק הראשון לא ישלם על ייבוא ספריות, ערוץ gRPC קר ומטמונים ריקים
+warmup_task = None
+
+async def check_ffmpeg():
+    try:
+        stdout, _ = await run_tool(["ffmpeg", "-hide_banner", "-version"], timeout=15)
+        logging.info(f"🎬 {stdout.decode(errors='replace').splitlines()[0]}")
+    except MediaToolError as e:
+        logging.error(f"❌ ffmpeg לא זמין, הודעות מדיה ייכשלו: {e}")
+
+async def warm_tts():
+    await tts.start()
+    # הפתיחים של הדקות הקרובות: מחממים את הערוץ לגוגל וממלאים את המטמון
+    suffixes = sorted({c["intro_suffix"] for c in CHANNELS_CONFIG.values() if c["intro_suffix"]})
+    now = datetime.now(timezone.utc)
+    texts = [intro_text_at(suffix, now + timedelta(minutes=offset)) for offset in range(3) for suffix in suffixes]
+    await asyncio.gather(*(tts.synthesize(text) for text in texts))
+
+def build_caches():
+    get_text_cleaner()
+    for chat_id in CHANNELS_CONFIG:
+        get_dedup_index(chat_id)
+        get_media_index(chat_id)
+
+async def warm_up():
+    # ייבוא NumPy (לטביעות השמע) בת'רד, כדי לא לעצור את לולאת האירועים
+    await asyncio.to_thread(importlib.import_module, "audio_fingerprint")
+    build_caches()
+    await asyncio.gather(check_ffmpeg(), warm_tts())
+    warm = time.perf_counter() - PROCESS_STARTED
+    STARTUP_SECONDS.set(warm, "warm")
+    logging.info(f"🌡️ החימום הסתיים {warm:.2f} שניות מתחילת התהליך.")
+
+async def on_startup(app):
+    global warmup_task
+    state.prune_jobs(7 * 24 * 3600)
+    await uploader.start()
+    if REPLICA_MODE:
+        shared_jobs.start()
+    ready = time.perf_counter() - PROCESS_STARTED
+    STARTUP_SECONDS.set(ready, "ready")
+    logging.info(f"✅ הבוט מוכן תוך {ready:.2f} שניות מתחילת התהליך.")
+    warmup_task = asyncio.create_task(warm_up())
+
+async def on_shutdown(app):
+    if warmup_task is not None and not warmup_task.done():
+        warmup_task.cancel()
+    # ממתינים (עד דקה) שהעבודות וההעלאות שבתור יסתיימו לפני סגירת החיבורים
+    if REPLICA_MODE:
+        # עבודות שעוד לא נתפסו נשארות בתור המשותף לעותקים האחרים
+        await shared_jobs.join(60)
+    else:
+        try:
+            await asyncio.wait_for(dispatcher.join(), 60)
+        except asyncio.TimeoutError:
+            logging.warning("⚠️ עבודות שלא הסתיימו בזמן הכיבוי בוטלו.")
+    # מבזקים שעדיין נאספים נשלחים עכשיו, לפני סגירת תור ההעלאות
+    await asyncio.gather(*(c.close() for c in coalescers.values()), return_exceptions=True)
+    await dispatcher.shutdown()
+    await uploader.close()
+    await shared_jobs.shutdown()
+    await download_client.aclose()
+    state.close()
+
+# כל ערוץ שומר על הסדר שלו, ערוצים שונים רצים במקביל
+dispatcher = ChannelDispatcher(process_message, max_concurrency=MAX_CONCURRENT_JOBS)
 
 # ---------------------------------------------------------
-# 🚀 הפעלה
+# 👥 מצב כמה עותקים (REPLICA_MODE=1, ראו replicas.py)
 # ---------------------------------------------------------
-from keep_alive import keep_alive
-keep_alive()
+# כמה תהליכים על אותה מכונה ועל אותו STATE_DB: אחד מקבל את העדכונים
+# מטלגרם (ואת שרת ה-HTTP), וכולם מעבדים עבודות מהתור המשותף.
+# עבודות שמורות במאגר, כך שהן לא הולכות לאיבוד באתחול.
+REPLICA_MODE = os.getenv("REPLICA_MODE") == "1"
+# מזהה ייחודי לכל הרצה, כדי שעבודות של הרצה קודמת לא ייחשבו שלנו
+REPLICA_ID = os.getenv("REPLICA_ID") or f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(3)}"
+LEADER_LEASE_SECONDS = float(os.getenv("LEADER_LEASE_SECONDS", "15"))
+
+shared_jobs = SharedJobQueue(
+    state,
+    process_queued_job,
+    owner=REPLICA_ID,
+    concurrency=MAX_CONCURRENT_JOBS,
+    lease=float(os.getenv("JOB_LEASE_SECONDS", "60")),
+    max_attempts=int(os.getenv("JOB_MAX_ATTEMPTS", "3")),
+)
+
+leader = None
+telegram_app = None
+
+# עומק התורים מחושב רק כשמישהו קורא את /metrics
+def queue_depths():
+    by_priority = (shared_jobs if REPLICA_MODE else dispatcher).pending_by_priority()
+    return {
+        ("jobs_text",): by_priority.get(PRIORITY_TEXT, 0),
+        ("jobs_media",): by_priority.get(PRIORITY_MEDIA, 0),
+        ("uploads",): uploader.pending(),
+    }
+
+QUEUE_DEPTH.set_function(queue_depths)
+
+# ---------------------------------------------------------
+# 🌐 שרת HTTP ומצב קבלת העדכונים
+# ---------------------------------------------------------
+# ב-webhook טלגרם דוחפת כל עדכון מיד לשרת ה-HTTP של הבוט (אותו שרת של
+# /wakeup ו-/metrics). BOT_MODE=polling מחזיר את השאיבה הרגילה כגיבוי.
+HTTP_PORT = int(os.getenv("PORT", "8080"))
+WEBHOOK_URL = (os.getenv("WEBHOOK_URL") or os.getenv("RENDER_EXTERNAL_URL") or "").rstrip("/")
+BOT_MODE = os.getenv("BOT_MODE", "webhook" if WEBHOOK_URL else "polling")
+WEBHOOK_PATH = "/telegram"
+# טוקן סודי שטלגרם שולחת בכל בקשה; ברירת המחדל נגזרת מטוקן הבוט
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or hashlib.sha256(f"webhook:{BOT_TOKEN}".encode()).hexdigest()[:32]
+
+http_server = None
+
+def health_status():
+    status = {
+        "status": "ok",
+        "mode": BOT_MODE,
+        "uploads_pending": uploader.pending(),
+    }
+    if REPLICA_MODE:
+        status["replica"] = REPLICA_ID
+        status["leader"] = leader is not None and leader.is_leader
+        status["jobs_pending"] = sum(shared_jobs.pending_by_priority().values())
+    else:
+        status["jobs_pending"] = dispatcher.total_pending()
+    return status
+
+async def start_receiving(app):
+    """שרת ה-HTTP, ולפי המצב גם ה-webhook או השאיבה מטלגרם"""
+    global http_server
+    from keep_alive import keep_alive
+    webhook = BOT_MODE == "webhook"
+    http_server = keep_alive(
+        HTTP_PORT,
+        application=app if webhook else None,
+        webhook_path=WEBHOOK_PATH,
+        secret_token=WEBHOOK_SECRET,
+        health=health_status,
+    )
+    if webhook:
+        await app.bot.set_webhook(
+            url=WEBHOOK_URL + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=Update.ALL_TYPES,
+        )
+        logging.info(f"🪝 webhook הוגדר: {WEBHOOK_URL}{WEBHOOK_PATH}")
+    elif REPLICA_MODE:
+        # ב-run_polling השאיבה מתחילה לבד; כאן רק העותק המחזיק שואב
+        await app.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+
+async def stop_receiving(app):
+    global http_server
+    if REPLICA_MODE and app.updater is not None and app.updater.running:
+        await app.updater.stop()
+    if http_server is not None:
+        http_server.stop()
+        http_server = None
+
+async def post_init(app):
+    global leader
+    await on_startup(app)
+    if REPLICA_MODE:
+        # רק העותק שמחזיק בחכירה מקבל עדכונים; האחרים מחכים שהיא תתפנה
+        leader = LeaderLease(
+            state, "telegram", REPLICA_ID, LEADER_LEASE_SECONDS,
+            on_acquired=lambda: start_receiving(app),
+            on_lost=lambda: stop_receiving(app),
+        )
+        leader.start()
+    else:
+        await start_receiving(app)
+
+async def post_shutdown(app):
+    if leader is not None:
+        await leader.stop()
+    await stop_receiving(app)
+    await on_shutdown(app)
+
+async def run_app(app):
+    """מריץ את הבוט בלי run_polling (webhook, או מצב כמה עותקים), עד SIGINT/SIGTERM"""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    async with app:
+        await post_init(app)
+        await app.start()
+        logging.info(f"🚀 הבוט התחיל לרוץ ({BOT_MODE}{', ' + REPLICA_ID if REPLICA_MODE else ''})...")
+        await stop.wait()
+        # קודם מפסיקים לקבל עדכונים (ומשחררים את החכירה), ורק אז עוצרים את העיבוד
+        if leader is not None:
+            await leader.stop()
+        await stop_receiving(app)
+        await app.stop()
+        # ה-webhook לא נמחק: טלגרם שומרת את העדכונים עד שהבוט חוזר
+        await post_shutdown(app)
+
+def build_application():
+    global telegram_app
+    builder = ApplicationBuilder().token(BOT_TOKEN)
+    if BOT_MODE == "webhook":
+        builder = builder.updater(None)
+    elif not REPLICA_MODE:
+        builder = builder.post_init(post_init).post_shutdown(post_shutdown)
+    app = telegram_app = builder.build()
 
-if __name__ == '__main__':
-    if not BOT_TOKEN:
-        logging.error("❌ BOT_TOKEN חסר!")
-        exit(1)
-        
-    app = ApplicationBuilder().token(BOT_TOKEN).build()
-    
     app.add_handler(CommandHandler("addword", add_word))
     app.add_handler(CommandHandler("delword", del_word))
     app.add_handler(CommandHandler("listwords", list_words))
@@ -526,6 +930,27 @@ if __name__ == '__main__':
     app.add_handler(CommandHandler("listreplace", list_replace))
     
     app.add_handler(TypeHandler(Update, handle_message))
-    
-    logging.info("🚀 הבוט התחיל לרוץ...")
-    app.run_polling()
+
+    # חימום אופציונלי של בנק הפתיחים ברקע
+    if os.getenv("TTS_WARMUP_INTROS") == "1":
+        app.job_queue.run_once(warm_intro_bank, 5)
+    return app
+
+# ---------------------------------------------------------
+# 🚀 הפעלה
+# ---------------------------------------------------------
+if __name__ == '__main__':
+    if not BOT_TOKEN:
+        logging.error("❌ BOT_TOKEN חסר!")
+        exit(1)
+
+    app = build_application()
+    if BOT_MODE == "webhook" and not WEBHOOK_URL:
+        logging.error("❌ BOT_MODE=webhook דורש WEBHOOK_URL!")
+        exit(1)
+    if BOT_MODE == "webhook" or REPLICA_MODE:
+        asyncio.run(run_app(app))
+    else:
+        logging.info("🚀 הבוט התחיל לרוץ (polling)...")
+        # מוחק webhook קודם אם היה, כדי שהשאיבה תקבל את העדכונים
+        app.run_polling(allowed_updates=Update.ALL_TYPES)
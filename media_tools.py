@@ -0,0 +1,236 @@
+import asyncio
+import logging
+import math
+import os
+import shutil
+import tempfile
+
+# ---------------------------------------------------------
+# 🎬 הרצת ffmpeg/ffprobe בלי לחסום את לולאת האירועים
+# ---------------------------------------------------------
+# כל הקריאות רצות כתהליכים אסינכרוניים, עם זמן קצוב לכל קריאה
+# ותקרה על מספר תהליכי ffmpeg שרצים במקביל.
+
+FFMPEG_CONCURRENCY = int(os.getenv("FFMPEG_CONCURRENCY", "2"))
+CONVERT_TIMEOUT = float(os.getenv("FFMPEG_TIMEOUT", "600"))
+
+# עוצמת שיא מתחתיה הקובץ נחשב שקט
+SILENCE_THRESHOLD_DB = -50.0
+
+_slots = asyncio.Semaphore(FFMPEG_CONCURRENCY)
+
+
+class MediaToolError(Exception):
+    """כשל בהרצת ffmpeg/ffprobe, כולל קוד היציאה ופלט השגיאה"""
+
+    def __init__(self, tool, returncode, stderr, message=None):
+        self.tool = tool
+        self.returncode = returncode
+        self.stderr = stderr or ""
+        tail = " | ".join(self.stderr.strip().splitlines()[-3:])
+        super().__init__(message or f"{tool} נכשל (קוד {returncode}): {tail}")
+
+
+class MediaToolTimeout(MediaToolError):
+    def __init__(self, tool, timeout, stderr=""):
+        super().__init__(tool, None, stderr, f"{tool} לא הסתיים תוך {timeout:g} שניות ונעצר")
+
+
+async def run_tool(args, timeout=CONVERT_TIMEOUT, input_data=None, check=True):
+    """מריץ כלי מדיה ומחזיר (stdout, stderr). תהליך תקוע או מבוטל נהרג."""
+    tool = os.path.basename(args[0])
+    async with _slots:
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *args,
+                stdin=asyncio.subprocess.PIPE if input_data is not None else asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
+        except OSError as e:
+            raise MediaToolError(tool, None, str(e), f"לא ניתן להפעיל את {tool}: {e}")
+        try:
+            stdout, stderr = await asyncio.wait_for(proc.communicate(input_data), timeout)
+        except asyncio.TimeoutError:
+            await _kill(proc)
+            raise MediaToolTimeout(tool, timeout)
+        except asyncio.CancelledError:
+            await _kill(proc)
+            raise
+
+    stderr = stderr.decode("utf-8", errors="replace")
+    if check and proc.returncode != 0:
+        raise MediaToolError(tool, proc.returncode, stderr)
+    return stdout, stderr
+
+
+async def _kill(proc):
+    if proc.returncode is None:
+        try:
+            proc.kill()
+        except ProcessLookupError:
+            pass
+        await proc.wait()
+
+
+# ---------------------------------------------------------
+# 📥 קליטת מדיה במעבר אחד
+# ---------------------------------------------------------
+# ההורדה מטלגרם מוזרמת ישירות לתהליך ffmpeg יחיד שמוציא PCM
+# (8kHz מונו 16 ביט). קיום ערוץ שמע ועוצמת השמע מחושבים ב-Python
+# תוך כדי הזרימה, כך שכל קובץ מפוענח פעם אחת בלבד.
+
+SILENCE_WINDOW_SECONDS = 20
+_PCM_BYTES_PER_SECOND = 8000 * 2
+_READ_SIZE = 64 * 1024
+# עותק ההורדה (לגיבוי מהדיסק) נשמר בזיכרון עד הגודל הזה, ומעליו בקובץ זמני
+_SPOOL_MEMORY_BYTES = 2 * 1024 * 1024
+
+# הודעות ffmpeg שמשמעותן שאין בקובץ ערוץ שמע
+_NO_AUDIO_MARKERS = ("does not contain any stream", "Output file is empty")
+# הודעות ffmpeg שמשמעותן שאי אפשר לקרוא את הקובץ מצינור (moov בסוף קובץ mp4)
+_NEEDS_SEEK_MARKERS = ("moov atom not found", "Invalid data found when processing input")
+
+
+class LevelMeter:
+    """מחשב עוצמת שיא ו-RMS (ב-dBFS) על תחילת ה-PCM, בחלקים.
+    החישוב ב-NumPy, כדי שלא ירוץ בלולאת פייתון על לולאת האירועים."""
+
+    def __init__(self, max_seconds=SILENCE_WINDOW_SECONDS):
+        self.max_bytes = max_seconds * _PCM_BYTES_PER_SECOND
+        self.seen = 0
+        self.peak = 0
+        self.sum_squares = 0
+        self.samples = 0
+        self._carry = b""
+
+    def feed(self, chunk):
+        if self.seen >= self.max_bytes:
+            return
+        chunk = self._carry + chunk[:self.max_bytes - self.seen]
+        usable = len(chunk) - len(chunk) % 2
+        self._carry = chunk[usable:]
+        self.seen += usable
+        # NumPy נטען ברקע בעליית הבוט (warm_up ב-main), וכאן כבר מהמטמון
+        import numpy as np
+        samples = np.frombuffer(chunk, dtype="<i2", count=usable // 2).astype(np.int64)
+        if len(samples):
+            self.peak = max(self.peak, int(samples.max()), -int(samples.min()))
+            self.sum_squares += int(np.dot(samples, samples))
+            self.samples += len(samples)
+
+    @staticmethod
+    def _db(value):
+        return 20 * math.log10(value / 32768) if value > 0 else float("-inf")
+
+    @property
+    def peak_db(self):
+        return self._db(self.peak)
+
+    @property
+    def rms_db(self):
+        return self._db(math.sqrt(self.sum_squares / self.samples)) if self.samples else float("-inf")
+
+
+class IngestResult:
+    def __init__(self, pcm, has_audio, meter):
+        self.pcm = pcm
+        self.has_audio = has_audio
+        self.peak_db = meter.peak_db
+        self.rms_db = meter.rms_db
+
+    @property
+    def is_silent(self):
+        return self.peak_db < SILENCE_THRESHOLD_DB
+
+
+_INGEST_ARGS = [
+    '-map', '0:a:0?', '-vn', '-sn', '-dn',
+    '-ar', '8000', '-ac', '1', '-acodec', 'pcm_s16le', '-f', 's16le', 'pipe:1'
+]
+
+
+async def ingest_media(chunks, fallback_path, timeout=CONVERT_TIMEOUT):
+    """מפענח מדיה מזרם של חלקי bytes ל-PCM במעבר ffmpeg אחד.
+
+    עותק של מה שנשלח ל-ffmpeg נשמר תוך כדי (קבצים קטנים בזיכרון, גדולים
+    בקובץ זמני); אם ffmpeg לא מצליח לקרוא מצינור, שאר ההורדה נקראת, הקובץ
+    המלא נכתב ל-fallback_path ומפוענח שוב מהדיסק.
+    """
+    chunks = aiter(chunks)
+    spool = tempfile.SpooledTemporaryFile(_SPOOL_MEMORY_BYTES, dir=os.path.dirname(fallback_path) or None)
+
+    async def tee():
+        async for chunk in chunks:
+            spool.write(chunk)
+            yield chunk
+
+    with spool:
+        try:
+            return await _ingest(['ffmpeg', '-v', 'error', '-i', 'pipe:0'] + _INGEST_ARGS, tee(), timeout)
+        except MediaToolError as e:
+            if not any(marker in e.stderr for marker in _NEEDS_SEEK_MARKERS):
+                raise
+            logging.info("↩️ ffmpeg לא הצליח לקרוא את הקובץ מצינור, מפענח מהדיסק.")
+
+        # ffmpeg יצא לפני סוף הקלט, וההורדה נעצרה באמצע: משלימים אותה
+        async for chunk in chunks:
+            spool.write(chunk)
+        spool.seek(0)
+        with open(fallback_path, "wb") as f:
+            shutil.copyfileobj(spool, f)
+    return await _ingest(['ffmpeg', '-v', 'error', '-i', fallback_path] + _INGEST_ARGS, None, timeout)
+
+
+async def _ingest(args, chunks, timeout):
+    meter = LevelMeter()
+    pcm = bytearray()
+    async with _slots:
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *args,
+                stdin=asyncio.subprocess.PIPE if chunks is not None else asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
+        except OSError as e:
+            raise MediaToolError("ffmpeg", None, str(e), f"לא ניתן להפעיל את ffmpeg: {e}")
+
+        async def feed():
+            try:
+                async for chunk in chunks:
+                    proc.stdin.write(chunk)
+                    await proc.stdin.drain()
+            except (BrokenPipeError, ConnectionResetError):
+                # ffmpeg סיים או נכשל לפני סוף הקלט; השגיאה תגיע מ-stderr
+                pass
+            finally:
+                proc.stdin.close()
+
+        async def read():
+            while True:
+                chunk = await proc.stdout.read(_READ_SIZE)
+                if not chunk:
+                    break
+                meter.feed(chunk)
+                pcm.extend(chunk)
+
+        tasks = [read(), proc.stderr.read()]
+        if chunks is not None:
+            tasks.append(feed())
+        try:
+            results = await asyncio.wait_for(asyncio.gather(*tasks), timeout)
+            await proc.wait()
+        except asyncio.TimeoutError:
+            await _kill(proc)
+            raise MediaToolTimeout("ffmpeg", timeout)
+        except BaseException:
+            await _kill(proc)
+            raise
+
+    stderr = results[1].decode("utf-8", errors="replace")
+    if proc.returncode != 0:
+        if any(marker in stderr for marker in _NO_AUDIO_MARKERS):
+            return IngestResult(b"", False, meter)
+        raise MediaToolError("ffmpeg", proc.returncode, stderr)
+    return IngestResult(bytes(pcm), bool(pcm), meter)
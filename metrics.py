@@ -0,0 +1,165 @@
+import bisect
+import time
+from contextlib import contextmanager
+
+# ---------------------------------------------------------
+# 📈 מדדים בפורמט Prometheus
+# ---------------------------------------------------------
+# מימוש מינימלי בלי תלות חיצונית: מונים, מדדים רגעיים והיסטוגרמות.
+# הכתיבות וגם /metrics (שרת tornado) רצים באותה לולאת אירועים, והרינדור
+# סינכרוני ולא נקטע באמצע - לכן אין צורך בנעילות או בהעתקת הנתונים.
+
+_REGISTRY = []
+
+# גבולות ברירת מחדל להיסטוגרמות זמן (שניות)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        _REGISTRY.append(self)
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def render(self):
+        lines = self._header()
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(_Metric):
+    """מדד רגעי; אפשר לתת פונקציה שמחושבת בזמן הקריאה ומחזירה {תוויות: ערך}"""
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), collect=None):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+        self._collect = collect
+
+    def set(self, value, *labels):
+        self._values[labels] = value
+
+    def set_function(self, collect):
+        self._collect = collect
+
+    def render(self):
+        values = self._values
+        if self._collect is not None:
+            values = {**values, **self._collect()}
+        lines = self._header()
+        for labels, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+
+    def observe(self, value, *labels):
+        series = self._series.get(labels)
+        if series is None:
+            # [ספירה לכל דלי..., דלי +Inf, סכום]
+            series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def count(self, *labels):
+        series = self._series.get(labels)
+        return sum(series[:-1]) if series else 0
+
+    def render(self):
+        lines = self._header()
+        for labels, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                le = _format_labels(self.labelnames, labels, [("le", _format_value(bound))])
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+def render():
+    lines = []
+    for metric in _REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ---------------------------------------------------------
+# 📊 מדדי הבוט
+# ---------------------------------------------------------
+STAGE_SECONDS = Histogram(
+    "mozik_stage_seconds", "Time spent in each pipeline stage", ["stage"])
+JOB_SECONDS = Histogram(
+    "mozik_job_seconds", "End-to-end time from receiving a post to its final outcome", ["channel"])
+QUEUE_WAIT_SECONDS = Histogram(
+    "mozik_queue_wait_seconds", "Time a job waited in its queue before a worker slot picked it up", ["queue"])
+MESSAGES = Counter(
+    "mozik_messages_total", "Processed posts by channel and outcome", ["channel", "outcome"])
+UPLOADS = Counter(
+    "mozik_uploads_total", "Yemot upload attempts by result", ["result"])
+TTS_REQUESTS = Counter(
+    "mozik_tts_requests_total", "Google TTS requests by result", ["result"])
+TTS_CHARACTERS = Counter(
+    "mozik_tts_characters_total", "Characters sent to Google TTS")
+TTS_CACHE = Counter(
+    "mozik_tts_cache_total", "TTS cache lookups", ["result"])
+FANOUT_REUSE = Counter(
+    "mozik_fanout_reuse_total", "Renders shared between copies of the same item", ["kind"])
+SHED = Counter(
+    "mozik_shed_total", "Stale posts dropped or downgraded to text only", ["channel", "action"])
+STARTUP_SECONDS = Gauge(
+    "mozik_startup_seconds", "Seconds from process start to each startup milestone", ["phase"])
+QUEUE_DEPTH = Gauge(
+    "mozik_queue_depth", "Jobs waiting in each queue", ["queue"])
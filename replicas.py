@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import sqlite3
+import time
+
+from metrics import QUEUE_WAIT_SECONDS
+
+# ---------------------------------------------------------
+# 👥 כמה עותקים של הבוט על אותו מאגר מצב
+# ---------------------------------------------------------
+# כל העותקים זהים. אחד מהם מחזיק בחכירה (lease) במאגר ה-SQLite ורק הוא
+# מקבל עדכונים מטלגרם; כל עדכון נרשם בטבלת העבודות כעבודה בתור. כל
+# העותקים (גם המחזיק) תופסים עבודות מהתור, מעבדים ומעלים, כך שהמרות
+# המדיה מתחלקות בין כמה ליבות. עותק מחדש את החכירות שלו כל שליש מזמנן;
+# אם הוא קורס, עותק אחר לוקח את קבלת העדכונים, והעבודות שלו חוזרות לתור.
+
+
+class LeaderLease:
+    def __init__(self, store, name, owner, ttl=15.0, on_acquired=None, on_lost=None):
+        self.store = store
+        self.name = name
+        self.owner = owner
+        self.ttl = ttl
+        self._on_acquired = on_acquired  # async, נקרא כשהעותק הופך למחזיק
+        self._on_lost = on_lost          # async, נקרא כשהחכירה אבדה או שוחררה
+        self._leader = False
+        self._task = None
+
+    @property
+    def is_leader(self):
+        return self._leader
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                held = self.store.acquire_lease(self.name, self.owner, self.ttl)
+            except sqlite3.Error as e:
+                logging.error(f"❌ שגיאה בחידוש החכירה {self.name}: {e}")
+                held = False
+            if held and not self._leader:
+                await self._become_leader()
+            elif not held and self._leader:
+                logging.warning(f"⚠️ החכירה {self.name} עברה לעותק אחר.")
+                await self._step_down()
+            await asyncio.sleep(self.ttl / 3)
+
+    async def _become_leader(self):
+        logging.info(f"👑 העותק {self.owner} מחזיק עכשיו ב-{self.name}.")
+        self._leader = True
+        try:
+            if self._on_acquired:
+                await self._on_acquired()
+        except Exception as e:
+            # לא מצליחים להתחיל (למשל הפורט עדיין תפוס): משחררים לעותק אחר
+            logging.exception(f"❌ נכשלה ההפעלה אחרי קבלת {self.name}: {e}")
+            await self._step_down()
+            self.store.release_lease(self.name, self.owner)
+
+    async def _step_down(self):
+        self._leader = False
+        try:
+            if self._on_lost:
+                await self._on_lost()
+        except Exception as e:
+            logging.exception(f"❌ שגיאה בעצירה אחרי אובדן {self.name}: {e}")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._leader:
+            await self._step_down()
+            # משחררים מיד, כדי שעותק אחר לא יחכה לפקיעת החכירה
+            self.store.release_lease(self.name, self.owner)
+
+
+class SharedJobQueue:
+    def __init__(self, store, handler, owner, concurrency=2, lease=60.0, poll_interval=0.5,
+                 max_attempts=3, name="jobs"):
+        self.store = store
+        self._handler = handler          # async handler(job_id, payload, created_at)
+        self.owner = owner
+        self.concurrency = concurrency
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.name = name
+        self._wakeup = asyncio.Event()
+        self._workers = []
+        self._heartbeat = None
+        self._stopping = False
+        self.active = 0
+
+    def start(self):
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        self._heartbeat = asyncio.create_task(self._renew())
+
+    def notify(self):
+        """עבודה חדשה נכנסה לתור מהתהליך הזה; מעיר עובד פנוי בלי לחכות לסבב"""
+        self._wakeup.set()
+
+    def pending_by_priority(self):
+        return self.store.queued_jobs()
+
+    async def _worker(self):
+        while not self._stopping:
+            try:
+                job = self.store.claim_job(self.owner, self.lease, self.max_attempts)
+            except sqlite3.Error as e:
+                logging.error(f"❌ שגיאה בתפיסת עבודה מהתור המשותף: {e}")
+                job = None
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            job_id, chat_id, payload, created_at = job
+            self.active += 1
+            try:
+                QUEUE_WAIT_SECONDS.observe(max(0.0, time.time() - created_at), self.name)
+                await self._handler(job_id, payload, created_at)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.exception(f"❌ שגיאה בעיבוד הודעה מערוץ {chat_id}: {e}")
+            finally:
+                self.active -= 1
+
+    async def _renew(self):
+        # מחזיק גם את העבודות שכבר בהעלאה, עד שהן מסתיימות
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            try:
+                self.store.renew_jobs(self.owner, self.lease)
+            except sqlite3.Error as e:
+                logging.error(f"❌ שגיאה בחידוש העבודות בתור המשותף: {e}")
+
+    async def join(self, timeout=60):
+        """מפסיק לתפוס עבודות וממתין (עד timeout) שהעבודות שבעיבוד יסתיימו"""
+        self._stopping = True
+        self._wakeup.set()
+        done, pending = await asyncio.wait(self._workers, timeout=timeout) if self._workers else (set(), set())
+        for worker in pending:
+            worker.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        if pending:
+            logging.warning("⚠️ עבודות שלא הסתיימו בזמן הכיבוי בוטלו.")
+        self._workers = []
+        # מה שהתחיל ולא הסתיים חוזר לתור מיד, ולא אחרי פקיעת החכירה
+        released = self.store.release_jobs(self.owner)
+        if released:
+            logging.info(f"↩️ {released} עבודות הוחזרו לתור המשותף.")
+
+    async def shutdown(self):
+        """אחרי שההעלאות הסתיימו: מפסיק לחדש את החכירה על העבודות"""
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            await asyncio.gather(self._heartbeat, return_exceptions=True)
+            self._heartbeat = None
@@ -0,0 +1,67 @@
+import re
+
+# ---------------------------------------------------------
+# ✂️ חלוקת טקסט לקטעים להקראה
+# ---------------------------------------------------------
+# גוגל דוחה בקשות מעל 5000 בתים, וגם מתחת לגבול הזה בקשה אחת
+# גדולה איטית יותר מכמה קטנות במקביל. הטקסט נחתך בגבולות משפטים,
+# ואם משפט ארוך מדי - בגבולות פסוקיות, מילים, ובמקרה קיצון תווים.
+
+GOOGLE_TTS_MAX_BYTES = 5000
+
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+_CLAUSE_END = re.compile(r'(?<=[,;:)])\s+')
+
+
+def _size(text):
+    return len(text.encode("utf-8"))
+
+
+def _split_chars(text, max_bytes):
+    pieces, current = [], ""
+    for ch in text:
+        if current and _size(current + ch) > max_bytes:
+            pieces.append(current)
+            current = ""
+        current += ch
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def _pack(units, max_bytes, joiner=" "):
+    """מאחד יחידות עוקבות לקטעים שלא עוברים את הגבול"""
+    chunks, current = [], ""
+    for unit in units:
+        candidate = f"{current}{joiner}{unit}" if current else unit
+        if _size(candidate) <= max_bytes:
+            current = candidate
+        else:
+            if current:
+                chunks.append(current)
+            current = unit
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _fit(text, max_bytes, splitters):
+    """מפרק יחידה גדולה מדי לפי סדר המפרידים, מהגס לעדין"""
+    if _size(text) <= max_bytes:
+        return [text]
+    if not splitters:
+        return _split_chars(text, max_bytes)
+    units = []
+    for part in splitters[0](text):
+        units.extend(_fit(part, max_bytes, splitters[1:]))
+    return _pack(units, max_bytes)
+
+
+def split_text(text, max_bytes=GOOGLE_TTS_MAX_BYTES):
+    """מחזיר רשימת קטעים לפי הסדר, כל אחד עד max_bytes בתים"""
+    text = (text or "").strip()
+    if not text:
+        return []
+    max_bytes = min(max_bytes, GOOGLE_TTS_MAX_BYTES)
+    splitters = (_SENTENCE_END.split, _CLAUSE_END.split, str.split)
+    return _fit(text, max_bytes, splitters)
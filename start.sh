@@ -1,2 +1,15 @@
 #!/bin/bash
-python main.py
+# REPLICAS=N מפעיל N עותקים על אותו מאגר מצב (ראו replicas.py).
+# לכל עותק קובץ לוג משלו (log.1.txt, log.2.txt...), כי עותקים שמסובבים
+# את אותו קובץ דורסים זה לזה; מזהה המעקב מאחד את ציר הזמן בין הקבצים.
+if [ "${REPLICAS:-1}" -gt 1 ]; then
+    export REPLICA_MODE=1
+    trap 'kill -TERM $(jobs -p) 2>/dev/null' TERM INT
+    for i in $(seq "$REPLICAS"); do
+        LOG_FILE="log.$i.txt" python main.py &
+    done
+    wait
+    wait
+else
+    python main.py
+fi
@@ -0,0 +1,358 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# ---------------------------------------------------------
+# 🗄️ מאגר מצב (SQLite במצב WAL)
+# ---------------------------------------------------------
+# רשימה שחורה, החלפות, היסטוריית כפילויות לכל ערוץ (טקסט ומדיה), רישום עבודות
+# (שמשמש גם כתור העבודות המשותף במצב כמה עותקים, ראו replicas.py) וחכירות.
+# כל כתיבה היא טרנזקציה, כך שקריאה באמצע כתיבה לא רואה מצב חלקי.
+# הרשימות נשמרות גם במטמון בזיכרון שמתרוקן בכל כתיבה, כך שקריאה
+# רגילה לא נוגעת בדיסק בכלל.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blacklist (
+    word TEXT PRIMARY KEY,
+    position INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS replacements (
+    source TEXT PRIMARY KEY,
+    target TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id INTEGER NOT NULL,
+    signature TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS history_chat ON history (chat_id, id);
+CREATE TABLE IF NOT EXISTS media_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id INTEGER NOT NULL,
+    file_unique_id TEXT,
+    fingerprint BLOB
+);
+CREATE INDEX IF NOT EXISTS media_history_chat ON media_history (chat_id, id);
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id INTEGER NOT NULL,
+    message_id INTEGER,
+    status TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# עבודה בתור המשותף: payload הוא העדכון מטלגרם (JSON), owner הוא העותק שתפס
+# אותה ו-lease_until הזמן שבו היא חוזרת לתור אם העותק הפסיק לחדש אותה
+JOB_QUEUE_COLUMNS = (
+    ("priority", "INTEGER NOT NULL DEFAULT 0"),
+    ("payload", "TEXT"),
+    ("owner", "TEXT"),
+    ("lease_until", "REAL"),
+    ("attempts", "INTEGER NOT NULL DEFAULT 0"),
+)
+
+
+class StateStore:
+    def __init__(self, path="bot_state.db"):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._migrate()
+        self._lock = threading.RLock()
+        self._cache = {}
+        self._lists_revision = self.get_meta("lists_revision")
+
+    def _migrate(self):
+        # עמודות התור נוספו לטבלת העבודות אחרי שכבר היו מאגרים קיימים
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        for name, kind in JOB_QUEUE_COLUMNS:
+            if name not in columns:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {name} {kind}")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, priority, id) WHERE payload IS NOT NULL")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            else:
+                self._conn.execute("COMMIT")
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _cached(self, name, loader):
+        value = self._cache.get(name)
+        if value is None:
+            value = self._cache[name] = loader()
+        return value
+
+    # כל שינוי ברשימות מקדם מונה גרסה, כדי שתהליכים אחרים ידעו לרענן
+    def _touch_lists(self, conn):
+        conn.execute(
+            "INSERT INTO meta (key, value) VALUES ('lists_revision', '1') "
+            "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1")
+        self._lists_revision = conn.execute("SELECT value FROM meta WHERE key = 'lists_revision'").fetchone()[0]
+
+    def refresh_lists(self):
+        """מחזיר True אם תהליך אחר שינה את הרשימות מאז הבדיקה הקודמת"""
+        revision = self.get_meta("lists_revision")
+        if revision == self._lists_revision:
+            return False
+        self._lists_revision = revision
+        self._cache.pop("blacklist", None)
+        self._cache.pop("replacements", None)
+        return True
+
+    # --- רשימה שחורה ---
+    def get_blacklist(self):
+        words = self._cached("blacklist", lambda: [row[0] for row in self._query(
+            "SELECT word FROM blacklist ORDER BY position")])
+        return list(words)
+
+    def add_word(self, word):
+        with self._transaction() as conn:
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO blacklist (word, position) "
+                "VALUES (?, (SELECT COALESCE(MAX(position), 0) + 1 FROM blacklist))", (word,))
+            self._touch_lists(conn)
+        self._cache.pop("blacklist", None)
+        return cur.rowcount > 0
+
+    def remove_word(self, word):
+        with self._transaction() as conn:
+            cur = conn.execute("DELETE FROM blacklist WHERE word = ?", (word,))
+            self._touch_lists(conn)
+        self._cache.pop("blacklist", None)
+        return cur.rowcount > 0
+
+    # --- החלפות ---
+    def get_replacements(self):
+        replacements = self._cached("replacements", lambda: dict(self._query(
+            "SELECT source, target FROM replacements ORDER BY rowid")))
+        return dict(replacements)
+
+    def set_replacement(self, source, target):
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO replacements (source, target) VALUES (?, ?) "
+                "ON CONFLICT(source) DO UPDATE SET target = excluded.target", (source, target))
+            self._touch_lists(conn)
+        self._cache.pop("replacements", None)
+
+    def remove_replacement(self, source):
+        with self._transaction() as conn:
+            cur = conn.execute("DELETE FROM replacements WHERE source = ?", (source,))
+            self._touch_lists(conn)
+        self._cache.pop("replacements", None)
+        return cur.rowcount > 0
+
+    # --- היסטוריית כפילויות (חתימות MinHash לכל ערוץ) ---
+    def load_history(self, chat_id, limit, after=0):
+        """[(מספר שורה, חתימה)] מהישנה לחדשה; after - רק שורות שנוספו מאז"""
+        rows = self._query(
+            "SELECT id, signature FROM (SELECT id, signature FROM history WHERE chat_id = ? AND id > ? "
+            "ORDER BY id DESC LIMIT ?) ORDER BY id", (chat_id, after, limit))
+        return [(row_id, json.loads(signature)) for row_id, signature in rows]
+
+    def append_history(self, chat_id, signature):
+        with self._transaction() as conn:
+            cur = conn.execute("INSERT INTO history (chat_id, signature) VALUES (?, ?)",
+                               (chat_id, json.dumps(signature, separators=(",", ":"))))
+        return cur.lastrowid
+
+    def trim_history(self, chat_id, keep):
+        with self._transaction() as conn:
+            conn.execute(
+                "DELETE FROM history WHERE chat_id = ? AND id NOT IN "
+                "(SELECT id FROM history WHERE chat_id = ? ORDER BY id DESC LIMIT ?)",
+                (chat_id, chat_id, keep))
+
+    # --- היסטוריית מדיה (file_unique_id וטביעת שמע לכל ערוץ) ---
+    def load_media_history(self, chat_id, limit, after=0):
+        """[(מספר שורה, file_unique_id, טביעה)] מהישנה לחדשה"""
+        return self._query(
+            "SELECT id, file_unique_id, fingerprint FROM (SELECT id, file_unique_id, fingerprint FROM media_history "
+            "WHERE chat_id = ? AND id > ? ORDER BY id DESC LIMIT ?) ORDER BY id", (chat_id, after, limit))
+
+    def append_media_history(self, chat_id, file_unique_id, fingerprint):
+        with self._transaction() as conn:
+            cur = conn.execute("INSERT INTO media_history (chat_id, file_unique_id, fingerprint) VALUES (?, ?, ?)",
+                               (chat_id, file_unique_id, fingerprint))
+        return cur.lastrowid
+
+    def trim_media_history(self, chat_id, keep):
+        with self._transaction() as conn:
+            conn.execute(
+                "DELETE FROM media_history WHERE chat_id = ? AND id NOT IN "
+                "(SELECT id FROM media_history WHERE chat_id = ? ORDER BY id DESC LIMIT ?)",
+                (chat_id, chat_id, keep))
+
+    # --- רישום עבודות ---
+    def create_job(self, chat_id, message_id, status="queued", priority=0, payload=None):
+        """payload: העדכון כ-JSON, כשהעבודה נכנסת לתור המשותף"""
+        now = time.time()
+        with self._transaction() as conn:
+            cur = conn.execute(
+                "INSERT INTO jobs (chat_id, message_id, status, created_at, updated_at, priority, payload) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (chat_id, message_id, status, now, now, priority, payload))
+        return cur.lastrowid
+
+    def update_job(self, job_id, status):
+        # עבודה שנכשלה נשארת במצב נכשל גם אם העלאה אחרת שלה הצליחה.
+        # בתוצאה סופית העבודה יוצאת מהתור המשותף (ה-payload כבר לא נחוץ).
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ?, "
+                "payload = CASE WHEN ? IN ('queued', 'processing', 'uploading') THEN payload END, "
+                "owner = CASE WHEN ? IN ('queued', 'processing', 'uploading') THEN owner END "
+                "WHERE id = ? AND status != 'failed'",
+                (status, time.time(), status, status, job_id))
+
+    # --- תור העבודות המשותף (כמה תהליכים על אותו מאגר) ---
+    def claim_job(self, owner, lease_seconds, max_attempts=3):
+        """תופס את העבודה הדחופה ביותר שאפשר לעבד עכשיו ומחזיר
+        (מזהה, ערוץ, payload, זמן יצירה), או None אם אין.
+        בערוץ שיש לו עבודה בעיבוד לא תופסים עבודה נוספת, וגם לא בערוץ שיש
+        לו העלאה פתוחה אצל עותק אחר - כך הסדר בשלוחה נשמר."""
+        now = time.time()
+        with self._transaction() as conn:
+            self._recover_jobs(conn, now, max_attempts)
+            row = conn.execute(
+                "SELECT id, chat_id, payload, created_at FROM jobs AS q "
+                "WHERE status = 'queued' AND payload IS NOT NULL AND NOT EXISTS ("
+                "  SELECT 1 FROM jobs AS o WHERE o.chat_id = q.chat_id AND o.owner IS NOT NULL "
+                "  AND (o.status = 'processing' OR (o.status = 'uploading' AND o.owner != ?))) "
+                "ORDER BY priority, id LIMIT 1", (owner,)).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'processing', owner = ?, lease_until = ?, "
+                "attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                (owner, now + lease_seconds, now, row[0]))
+        return row
+
+    def _recover_jobs(self, conn, now, max_attempts):
+        # עבודות של עותק שהפסיק לחדש אותן (קרס או נתקע) חוזרות לתור;
+        # עבודה שהפילה את העותקים שוב ושוב נכשלת במקום לחזור בלי סוף
+        expired = "owner IS NOT NULL AND lease_until < ? AND status IN ('processing', 'uploading')"
+        failed = conn.execute(
+            f"UPDATE jobs SET status = 'failed', payload = NULL, owner = NULL, updated_at = ? "
+            f"WHERE {expired} AND attempts >= ?", (now, now, max_attempts)).rowcount
+        if failed:
+            logging.error(f"❌ {failed} עבודות נכשלו אחרי {max_attempts} ניסיונות ויצאו מהתור.")
+        conn.execute(f"UPDATE jobs SET status = 'queued', owner = NULL, updated_at = ? WHERE {expired}",
+                     (now, now))
+
+    def renew_jobs(self, owner, lease_seconds):
+        """מאריך את החכירה על כל העבודות שהעותק מחזיק"""
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE owner = ? AND status IN ('processing', 'uploading')",
+                (time.time() + lease_seconds, owner))
+
+    def release_jobs(self, owner):
+        """מחזיר לתור עבודות שהעותק התחיל ולא סיים (בכיבוי)"""
+        with self._transaction() as conn:
+            cur = conn.execute(
+                "UPDATE jobs SET status = 'queued', owner = NULL, attempts = MAX(attempts - 1, 0), updated_at = ? "
+                "WHERE owner = ? AND status = 'processing'", (time.time(), owner))
+        return cur.rowcount
+
+    def queued_jobs(self):
+        """{עדיפות: מספר עבודות שממתינות בתור המשותף}"""
+        return dict(self._query(
+            "SELECT priority, COUNT(*) FROM jobs WHERE status = 'queued' AND payload IS NOT NULL GROUP BY priority"))
+
+    # --- חכירות (למשל: איזה עותק מקבל את העדכונים מטלגרם) ---
+    def acquire_lease(self, name, owner, ttl):
+        """תופס או מחדש חכירה; מצליח רק אם היא פנויה, פגה או כבר שלנו"""
+        now = time.time()
+        with self._transaction() as conn:
+            cur = conn.execute(
+                "INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+                "WHERE leases.owner = excluded.owner OR leases.expires_at < ?",
+                (name, owner, now + ttl, now))
+        return cur.rowcount > 0
+
+    def release_lease(self, name, owner):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner))
+
+    def lease_owner(self, name):
+        rows = self._query("SELECT owner FROM leases WHERE name = ? AND expires_at >= ?", (name, time.time()))
+        return rows[0][0] if rows else None
+
+    def prune_jobs(self, max_age_seconds):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM jobs WHERE updated_at < ?", (time.time() - max_age_seconds,))
+
+    # --- meta ---
+    def get_meta(self, key, default=None):
+        rows = self._query("SELECT value FROM meta WHERE key = ?", (key,))
+        return rows[0][0] if rows else default
+
+    def set_meta(self, key, value):
+        with self._transaction() as conn:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    # --- ייבוא חד-פעמי מקבצי ה-JSON הישנים ---
+    def migrate_from_json(self, blacklist_file, replacements_file, history=None):
+        """מייבא את קבצי ה-JSON פעם אחת. history: {chat_id: [חתימות]}"""
+        if self.get_meta("json_migrated"):
+            return False
+        blacklist = _read_json(blacklist_file, [])
+        replacements = _read_json(replacements_file, {})
+        with self._transaction() as conn:
+            for position, word in enumerate(blacklist, start=1):
+                conn.execute("INSERT OR IGNORE INTO blacklist (word, position) VALUES (?, ?)", (word, position))
+            for source, target in replacements.items():
+                conn.execute("INSERT OR REPLACE INTO replacements (source, target) VALUES (?, ?)", (source, target))
+            for chat_id, signatures in (history or {}).items():
+                conn.executemany("INSERT INTO history (chat_id, signature) VALUES (?, ?)",
+                                 [(chat_id, json.dumps(sig, separators=(",", ":"))) for sig in signatures])
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('json_migrated', ?)", (str(time.time()),))
+        self._cache.clear()
+        logging.info(f"🗄️ יובאו {len(blacklist)} מילים חסומות ו-{len(replacements)} החלפות מקבצי JSON.")
+        return True
+
+
+def _read_json(filename, default):
+    if not filename or not os.path.exists(filename):
+        return default
+    try:
+        with open(filename, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        logging.error(f"❌ לא הצלחתי לקרוא את {filename} לייבוא: {e}")
+        return default
+    return data if isinstance(data, type(default)) else default
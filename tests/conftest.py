@@ -0,0 +1,5 @@
+import os
+import sys
+
+# המודולים של הבוט יושבים בשורש המאגר, בלי חבילה
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from audio_fingerprint import MAX_FRAMES, MIN_FRAMES, MediaDuplicateIndex, fingerprint, similarity
+
+
+def make_clip(seed, seconds=20):
+    rnd = np.random.default_rng(seed)
+    t = np.arange(seconds * 8000) / 8000
+    signal = sum(np.sin(2 * np.pi * f * t * (1 + 0.01 * np.sin(t * rnd.random())))
+                 for f in rnd.uniform(300, 3000, 6)) * 3000
+    signal += rnd.normal(0, 500, len(t))
+    return np.clip(signal, -32768, 32767).astype("<i2").tobytes()
+
+
+def loop_find(index, items, fp):
+    """החיפוש הישן: similarity מול כל קטע בחלון, בלולאה"""
+    best = None
+    for other in items:
+        if other is None or abs(len(other) - len(fp)) > max(6, 0.1 * len(fp)):
+            continue
+        score = similarity(fp, other)
+        if score >= index.threshold and (best is None or score > best):
+            best = score
+    return best
+
+
+def test_vectorised_find_matches_pairwise_similarity():
+    rnd = np.random.default_rng(3)
+    base = rnd.integers(0, 1 << 15, MAX_FRAMES, dtype=np.uint16)
+    items = []
+    index = MediaDuplicateIndex(threshold=0.5, window=40)
+    for i in range(60):
+        if i % 7 == 0:
+            fp = None
+        else:
+            length = int(rnd.integers(MIN_FRAMES - 5, 400))
+            fp = base[:length].copy()
+            # חלק מהביטים מתהפכים, כך שהדמיון משתנה בין הקטעים
+            fp ^= (rnd.random(length) < i / 120).astype(np.uint16) << rnd.integers(0, 15, length).astype(np.uint16)
+        index.add(f"id{i}", fp, persist=False)
+        items = (items + [fp])[-40:]
+    found = 0
+    for length in (MIN_FRAMES, 100, 250, 399):
+        probe = base[:length].copy()
+        expected = loop_find(index, items, probe)
+        if expected is None:
+            assert index.find(probe) is None
+        else:
+            found += 1
+            assert index.find(probe) == pytest.approx(expected)
+    assert found
+
+
+def test_reencoded_copy_is_detected():
+    index = MediaDuplicateIndex(threshold=0.6, window=10)
+    clip = make_clip(1)
+    assert index.check_and_add("a", clip) == (False, 0.0)
+    assert index.check_and_add("b", make_clip(2)) == (False, 0.0)
+    # אותו קטע בעוצמה אחרת ועם רעש נוסף
+    samples = np.frombuffer(clip, dtype="<i2").astype(np.float64) * 0.7
+    samples += np.random.default_rng(9).normal(0, 200, len(samples))
+    copy = np.clip(samples, -32768, 32767).astype("<i2").tobytes()
+    is_duplicate, score = index.check_and_add("c", copy)
+    assert is_duplicate and score > 0.6
+    assert index.seen_file("c")
+
+
+def test_window_evicts_oldest():
+    index = MediaDuplicateIndex(threshold=0.6, window=2)
+    clip = make_clip(1)
+    index.check_and_add("a", clip)
+    index.check_and_add("b", make_clip(2))
+    index.check_and_add("c", make_clip(3))
+    assert not index.seen_file("a")
+    fp, score = index.match(clip)
+    assert fp is not None and score is None
+    assert fingerprint(b"\0" * 32000) is None
@@ -0,0 +1,46 @@
+import asyncio
+
+from fanout import RenderCache
+
+
+def test_concurrent_requests_share_one_render():
+    calls = []
+
+    async def render():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return b"pcm"
+
+    async def go():
+        cache = RenderCache(window=10)
+        return await asyncio.gather(*(cache.get_or_render("k", render) for _ in range(3)))
+
+    assert asyncio.run(go()) == [b"pcm"] * 3
+    assert len(calls) == 1
+
+
+def test_expired_results_are_evicted_without_new_renders():
+    async def go():
+        cache = RenderCache(window=0.05, size=len)
+        await cache.get_or_render("a", lambda: asyncio.sleep(0, b"x" * 100))
+        assert len(cache) == 1 and cache.total_bytes == 100
+        # אין בקשות נוספות: הטיימר מוחק את התוצאה בסוף החלון
+        await asyncio.sleep(0.1)
+        return cache
+
+    cache = asyncio.run(go())
+    assert len(cache) == 0 and cache.total_bytes == 0
+
+
+def test_byte_cap_evicts_oldest_results():
+    async def go():
+        cache = RenderCache(window=60, max_items=10, max_bytes=250, size=len)
+        for key in "abc":
+            await cache.get_or_render(key, lambda: asyncio.sleep(0, b"x" * 100))
+        # תוצאה גדולה מהתקרה לא נשמרת בכלל
+        await cache.get_or_render("big", lambda: asyncio.sleep(0, b"x" * 1000))
+        return cache
+
+    cache = asyncio.run(go())
+    assert list(cache._entries) == ["b", "c"]
+    assert cache.total_bytes == 200
@@ -0,0 +1,75 @@
+import asyncio
+import math
+import os
+import random
+import stat
+import struct
+import sys
+import textwrap
+
+import media_tools
+
+# ffmpeg מדומה: מצינור הוא קורא חלק מהקלט ונכשל כמו בקובץ mp4 שה-moov שלו
+# בסוף; מקובץ הוא "מפענח" על ידי העתקת הקובץ כמו שהוא ל-stdout
+FAKE_FFMPEG = textwrap.dedent("""\
+    #!{python}
+    import sys
+    args = sys.argv[1:]
+    source = args[args.index("-i") + 1]
+    if source == "pipe:0":
+        sys.stdin.buffer.read(130000)
+        sys.stderr.write("pipe:0: Invalid data found when processing input\\n")
+        sys.exit(1)
+    with open(source, "rb") as f:
+        sys.stdout.buffer.write(f.read())
+""")
+
+
+def install_fake_ffmpeg(tmp_path, monkeypatch):
+    path = tmp_path / "bin" / "ffmpeg"
+    path.parent.mkdir()
+    path.write_text(FAKE_FFMPEG.format(python=sys.executable))
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{path.parent}{os.pathsep}{os.environ['PATH']}")
+
+
+async def download(data, size=8192):
+    for i in range(0, len(data), size):
+        await asyncio.sleep(0)
+        yield data[i:i + size]
+
+
+def test_fallback_reads_rest_of_download(tmp_path, monkeypatch):
+    install_fake_ffmpeg(tmp_path, monkeypatch)
+    data = os.urandom(1_000_000)
+    fallback = tmp_path / "media.mp4"
+
+    result = asyncio.run(media_tools.ingest_media(download(data), str(fallback)))
+
+    assert fallback.read_bytes() == data
+    assert result.pcm == data
+
+
+def test_fallback_when_download_spills_to_disk(tmp_path, monkeypatch):
+    install_fake_ffmpeg(tmp_path, monkeypatch)
+    monkeypatch.setattr(media_tools, "_SPOOL_MEMORY_BYTES", 64 * 1024)
+    data = os.urandom(300_000)
+    fallback = tmp_path / "media.mp4"
+
+    result = asyncio.run(media_tools.ingest_media(download(data), str(fallback)))
+
+    assert result.pcm == data
+
+
+def test_level_meter_matches_sample_math():
+    rnd = random.Random(5)
+    samples = [rnd.randint(-32768, 32767) for _ in range(50001)] + [-32768]
+    pcm = struct.pack(f"<{len(samples)}h", *samples)
+    meter = media_tools.LevelMeter(max_seconds=10)
+    # חלקים באורך אי-זוגי: חצי דגימה עובר לחלק הבא
+    for start in range(0, len(pcm), 4097):
+        meter.feed(pcm[start:start + 4097])
+    assert meter.peak == 32768
+    assert meter.samples == len(samples)
+    assert meter.sum_squares == sum(s * s for s in samples)
+    assert meter.rms_db == 20 * math.log10(math.sqrt(meter.sum_squares / len(samples)) / 32768)
@@ -0,0 +1,89 @@
+import json
+import os
+import re
+
+import pytest
+
+from bench.clean_text_bench import make_posts
+from text_cleaner import TextCleaner
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def original_clean_text(text, replacements, blocked_words):
+    """clean_text כפי שהיה ב-main.py, בלי שינוי מלבד קבלת הרשימות כפרמטרים"""
+    if not text: return ""
+    sorted_keys = sorted(replacements.keys(), key=len, reverse=True)
+    for src in sorted_keys:
+        target = replacements[src]
+        text = text.replace(src, target)
+    for word in blocked_words:
+        text = text.replace(word, '')
+    text = re.sub(r'https?://\S+', '', text)
+    text = re.sub(r'www\.\S+', '', text)
+    text = re.sub(r'chat\.whatsapp\.com\S*', '', text)
+    text = re.sub(r'wa\.me\S*', '', text)
+    text = re.sub(r't\.me\S*', '', text)
+    text = re.sub(r'[a-zA-Z0-9-]+\.(com|co\.il|net|org|me)\S*', '', text)
+    text = re.sub(r'@\S+', '', text)
+    text = re.sub(r'\d{2,3}[-\s]?\d{3}[-\s]?\d{4}', '', text)
+    text = re.sub(r'[^\w\s.,!?()\u0590-\u05FF]', '', text)
+    text = re.sub(r'\s+', ' ', text).strip()
+    return text
+
+
+def load(name):
+    with open(os.path.join(ROOT, name), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def assert_same(text, replacements, blacklist):
+    expected = original_clean_text(text, replacements, blacklist)
+    assert TextCleaner(replacements, blacklist).clean(text) == expected
+    return expected
+
+
+def test_chained_replacements():
+    # ההחלפה של "ab" יוצרת "xc", שמוחלף בסבב הבא
+    assert assert_same("abc", {"ab": "x", "xc": "Y"}, []) == "Y"
+
+
+def test_replacement_output_is_blacklisted():
+    assert assert_same("אמר ר' יוסי היום", {"ר'": "רבי"}, ["רבי יוסי"]) == "אמר היום"
+
+
+@pytest.mark.parametrize("target", ["@", "-", "@tag", "t.me/x"])
+def test_replacement_output_is_stripped(target):
+    assert_same("שלום עולם וכו", {"עולם": target}, [])
+
+
+def test_blacklist_order_is_kept():
+    # המילה הקצרה ברשימה נמחקת קודם ומשאירה שארית, בדיוק כמו במקור
+    blacklist = ["לעדכוני", "לעדכוני הפרגוד בטלגרם"]
+    assert assert_same("חדשות. לעדכוני הפרגוד בטלגרם", {}, blacklist) == "חדשות. הפרגוד בטלגרם"
+
+
+def test_equal_length_sources_keep_list_order():
+    assert_same("abc", {"bc": "1", "ab": "2"}, [])
+    assert_same("abc", {"ab": "2", "bc": "1"}, [])
+
+
+@pytest.mark.parametrize("text", ["", None, "   ", "בלי שום דבר מיוחד"])
+def test_trivial_texts(text):
+    assert_same(text, {"א": "ב"}, ["ג"])
+
+
+def test_repo_lists_on_generated_posts():
+    replacements = load("replacements.json")
+    blacklist = load("blacklist.json")
+    cleaner = TextCleaner(replacements, blacklist)
+    for post in make_posts(300, seed=11):
+        assert cleaner.clean(post) == original_clean_text(post, replacements, blacklist)
+
+
+# --- הבדלים מכוונים מהמקור ---
+
+def test_empty_source_is_ignored():
+    # במקור מקור ריק הכניס את היעד בין כל שני תווים; כאן הוא מדולג
+    assert TextCleaner({"": "X"}, []).clean("אבג") == "אבג"
+    assert original_clean_text("אבג", {"": "X"}, []) == "XאXבXגX"
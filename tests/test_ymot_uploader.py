@@ -0,0 +1,145 @@
+import asyncio
+import socket
+
+import pytest
+
+from bench import ymot_standin
+from ymot_uploader import UploadError, YmotUploader
+
+
+@pytest.fixture
+def standin():
+    servers = []
+
+    def start(**kwargs):
+        server = ymot_standin.start(**kwargs)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def make_uploader(port, **kwargs):
+    kwargs.setdefault("backoff_base", 0.01)
+    kwargs.setdefault("backoff_max", 0.05)
+    kwargs.setdefault("verify_delay", 0.01)
+    return YmotUploader("token", base_url=f"http://127.0.0.1:{port}/ym/api/", **kwargs)
+
+
+def run_upload(uploader, data, path="ivr2:1/", calls=None):
+    async def go():
+        if calls is not None:
+            post_once = uploader._post_once
+
+            async def counted(*args):
+                calls.append(args)
+                return await post_once(*args)
+            uploader._post_once = counted
+        try:
+            return await uploader.upload(data, path)
+        finally:
+            await uploader.close()
+    return asyncio.run(go())
+
+
+def test_full_upload_is_not_repeated_after_read_timeout(standin):
+    # השרת מקבל ושומר את הקובץ, אבל התשובה מגיעה אחרי שהלקוח כבר ויתר;
+    # הבדיקה ברשימת הקבצים מוצאת אותו והוא לא נשלח שוב
+    server = standin(latency=0.6)
+    uploader = make_uploader(server.server_port, read_timeout=0.3, max_attempts=4, verify_delay=0.6)
+    calls = []
+    result = run_upload(uploader, b"RIFF" + bytes(1000), calls=calls)
+    assert result["verified"] and result["path"] == "000.wav"
+    assert len(calls) == 1
+    assert len(server.received) == 1
+
+
+@pytest.mark.parametrize("status", [502, 503])
+def test_unavailable_full_upload_is_retried(standin, status):
+    server = standin(error_rate=1.0, error_status=status)
+    uploader = make_uploader(server.server_port, max_attempts=4)
+    calls = []
+    with pytest.raises(UploadError) as error:
+        run_upload(uploader, b"RIFF" + bytes(1000), calls=calls)
+    assert error.value.retryable
+    assert len(calls) == 4
+
+
+def test_transient_unavailable_recovers(standin):
+    server = standin(error_rate=0.5, seed=4)
+    uploader = make_uploader(server.server_port, max_attempts=8)
+    data = b"RIFF" + bytes(1000)
+    result = run_upload(uploader, data)
+    assert server.stats["errors"] > 0
+    assert result["responseStatus"] == "OK"
+    assert server.received == [("ivr2:1/", data)]
+
+
+def test_ambiguous_error_resends_only_when_nothing_was_stored(standin):
+    server = standin(error_rate=1.0, error_status=500)
+    uploader = make_uploader(server.server_port, max_attempts=3)
+    calls = []
+    with pytest.raises(UploadError):
+        run_upload(uploader, b"RIFF" + bytes(1000), calls=calls)
+    assert len(calls) == 3
+    assert server.received == []
+
+
+def test_ambiguous_error_after_store_is_not_resent(standin):
+    server = standin(error_rate=1.0, error_status=504, error_after_store=True)
+    uploader = make_uploader(server.server_port, max_attempts=4)
+    calls = []
+    result = run_upload(uploader, b"RIFF" + bytes(1000), calls=calls)
+    assert result["verified"]
+    assert len(calls) == 1
+    assert len(server.received) == 1
+
+
+def test_connect_error_is_retried():
+    # פורט שאף אחד לא מאזין לו: הבקשה לא יצאה, ומותר לנסות שוב
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    uploader = make_uploader(port, max_attempts=3)
+    calls = []
+    with pytest.raises(UploadError) as error:
+        run_upload(uploader, b"RIFF" + bytes(1000), calls=calls)
+    assert error.value.retryable
+    assert len(calls) == 3
+
+
+def count_parts(uploader, calls):
+    post_part = uploader._post_part
+
+    async def counted(fields, chunk, filename):
+        calls.append(int(fields["qqpartindex"]))
+        return await post_part(fields, chunk, filename)
+    uploader._post_part = counted
+
+
+def test_chunked_upload_survives_dropped_parts(standin):
+    server = standin(drop_rate=0.3, seed=3)
+    uploader = make_uploader(server.server_port, max_attempts=6, chunk_threshold=4096, chunk_size=1024)
+    data = bytes(range(256)) * 40 + b"tail"
+    calls = []
+    count_parts(uploader, calls)
+    run_upload(uploader, data)
+    assert server.stats["dropped"] > 0
+    assert len(server.received) == 1
+    assert server.received[0][1] == data
+    assert max(calls.count(i) for i in set(calls)) <= 6
+
+
+def test_chunked_part_attempts_are_bounded(standin):
+    # כל החלקים נופלים: כל חלק נשלח max_attempts פעמים בדיוק, ולא יותר
+    server = standin(drop_rate=1.0)
+    uploader = make_uploader(server.server_port, max_attempts=3, chunk_threshold=2048, chunk_size=1024)
+    calls = []
+    count_parts(uploader, calls)
+    with pytest.raises(UploadError):
+        run_upload(uploader, bytes(4000))
+    assert sorted(calls) == [i for i in range(4) for _ in range(3)]
+    assert server.received == []
@@ -0,0 +1,51 @@
+import re
+
+# ---------------------------------------------------------
+# 🧹 מנוע ניקוי טקסט מוכן מראש
+# ---------------------------------------------------------
+# הרשימות נטענות וממוינות פעם אחת ונבנות מחדש רק כשהן משתנות, והדפוסים
+# הקבועים מקומפלים מראש - בלי קריאת קבצים ומיון בכל הודעה. סדר הפעולות
+# זהה לקוד המקורי: החלפות (מהארוך לקצר, כל אחת על התוצאה של הקודמת),
+# מחיקת הרשימה השחורה לפי הסדר שלה, ואז הדפוסים הקבועים. ביטוי מאוחד
+# אחד לא שומר על הסדר הזה (החלפה שיוצרת מקור של החלפה אחרת, מילה חסומה
+# או תו שנמחק, וביטויים שחופפים זה לזה), ולכן הניקוי עדיין עובר על כל
+# פריט ברשימות - הזמן גדל עם אורך הרשימות.
+
+# דפוסי ניקוי קבועים (קישורים, טלפונים, תיוגים ותווים לא רצויים), לפי הסדר
+STATIC_PATTERNS = (
+    r'https?://\S+',
+    r'www\.\S+',
+    r'chat\.whatsapp\.com\S*',
+    r'wa\.me\S*',
+    r't\.me\S*',
+    r'[a-zA-Z0-9-]+\.(?:com|co\.il|net|org|me)\S*',
+    r'@\S+',
+    r'\d{2,3}[-\s]?\d{3}[-\s]?\d{4}',
+    r'[^\w\s.,!?()\u0590-\u05FF]+',
+)
+
+_STATIC = tuple(re.compile(pattern) for pattern in STATIC_PATTERNS)
+
+
+class TextCleaner:
+    """ניקוי טקסט לפי רשימת החלפות ורשימה שחורה, בדיוק כמו clean_text המקורי"""
+
+    def __init__(self, replacements, blacklist):
+        # מקור ריק היה מכניס את היעד בין כל שני תווים; מדלגים עליו
+        replacements = {src: dst for src, dst in (replacements or {}).items() if src}
+        self.replacements = replacements
+        self.blacklist = [w for w in (blacklist or []) if w]
+        self._replacements = [(src, replacements[src]) for src in sorted(replacements, key=len, reverse=True)]
+
+    def clean(self, text):
+        if not text:
+            return ""
+        for src, dst in self._replacements:
+            if src in text:
+                text = text.replace(src, dst)
+        for word in self.blacklist:
+            if word in text:
+                text = text.replace(word, '')
+        for pattern in _STATIC:
+            text = pattern.sub('', text)
+        return ' '.join(text.split())
@@ -0,0 +1,165 @@
+import asyncio
+import itertools
+import logging
+import time
+
+from audio import SAMPLE_RATE, wav_to_pcm
+from fanout import RenderCache
+from metrics import FANOUT_REUSE, TTS_CACHE, TTS_CHARACTERS, TTS_REQUESTS
+from segmenter import split_text
+from tts_cache import cache_key
+
+# ---------------------------------------------------------
+# 🎤 שירות TTS עם לקוח קבוע
+# ---------------------------------------------------------
+# הלקוחות (ערוץ gRPC, אימות ו-TLS) נוצרים פעם אחת בעליית הבוט
+# ומשמשים את כל ההודעות. כל קריאה מוגבלת בזמן ומנוסה שוב
+# בשגיאות זמניות של גוגל.
+# ספריות גוגל (כרבע שנייה של ייבוא) נטענות רק ב-start, בת'רד נפרד,
+# כך שהן לא מעכבות את עליית הבוט ולא חוסמות את לולאת האירועים.
+
+TTS_VOICE = "he-IL-Wavenet-B"
+TTS_SPEAKING_RATE = 1.2
+TTS_ENCODING = f"LINEAR16/{SAMPLE_RATE}"
+
+
+class TTSService:
+    def __init__(self, cache=None, pool_size=1, timeout=15.0, deadline=30.0, chunk_bytes=1500, fanout=4,
+                 credentials_info=None):
+        self.cache = cache
+        self.pool_size = max(1, pool_size)
+        self.chunk_bytes = chunk_bytes
+        # תקרה על מספר הבקשות לגוגל שיוצאות במקביל
+        self._fanout = asyncio.Semaphore(max(1, fanout))
+        self.timeout = timeout
+        self.deadline = deadline
+        # מפתח חשבון השירות כמילון (מהזיכרון, בלי קובץ); None = אימות ברירת המחדל של גוגל
+        self.credentials_info = credentials_info
+        self._texttospeech = None
+        self._start_lock = asyncio.Lock()
+        self._clients = []
+        self._next_client = None
+        # אותו טקסט שמתבקש במקביל (למשל מכמה ערוצים) נשלח לגוגל פעם אחת
+        self._inflight = RenderCache(window=0, on_reuse=lambda key: FANOUT_REUSE.inc("tts"))
+        # נתוני זמני תגובה של גוגל
+        self.calls = 0
+        self.failures = 0
+        self.total_latency = 0.0
+        self.last_latency = None
+
+    async def start(self):
+        """יוצר את הלקוחות; חייב לרוץ בתוך לולאת האירועים של הבוט"""
+        async with self._start_lock:
+            if self._clients:
+                return
+            try:
+                credentials = await asyncio.to_thread(self._prepare)
+                tts_module = self._texttospeech
+                self._clients = [tts_module.TextToSpeechAsyncClient(credentials=credentials)
+                                 for _ in range(self.pool_size)]
+            except Exception as e:
+                logging.error(f"❌ נכשל ביצירת לקוח TTS: {e}")
+                return
+            self._next_client = itertools.cycle(self._clients)
+            logging.info(f"🎤 נוצרו {len(self._clients)} לקוחות TTS קבועים.")
+
+    def _prepare(self):
+        """ייבוא ספריות גוגל והכנת ההגדרות הקבועות (רץ בת'רד)"""
+        from google.api_core import exceptions as google_exceptions
+        from google.api_core import retry_async
+        from google.cloud import texttospeech
+
+        # שגיאות זמניות שכדאי לנסות שוב
+        retryable = (
+            google_exceptions.ServiceUnavailable,
+            google_exceptions.DeadlineExceeded,
+            google_exceptions.InternalServerError,
+            google_exceptions.TooManyRequests,
+        )
+        self.retry = retry_async.AsyncRetry(
+            predicate=retry_async.if_exception_type(*retryable),
+            initial=0.25,
+            maximum=4.0,
+            multiplier=2.0,
+            timeout=self.deadline,
+        )
+        self.voice = texttospeech.VoiceSelectionParams(
+            language_code="he-IL", name=TTS_VOICE, ssml_gender=texttospeech.SsmlVoiceGender.MALE
+        )
+        self.audio_config = texttospeech.AudioConfig(
+            audio_encoding=texttospeech.AudioEncoding.LINEAR16,
+            sample_rate_hertz=SAMPLE_RATE,
+            speaking_rate=TTS_SPEAKING_RATE
+        )
+        self._texttospeech = texttospeech
+        if not self.credentials_info:
+            return None
+        from google.oauth2 import service_account
+        return service_account.Credentials.from_service_account_info(self.credentials_info)
+
+    def key(self, text):
+        return cache_key(text, TTS_VOICE, TTS_SPEAKING_RATE, TTS_ENCODING)
+
+    async def synthesize(self, text):
+        """מחזיר PCM לטקסט, מהמטמון אם כבר נוצר בעבר. בכישלון מחזיר None."""
+        if not text: return None
+        key = self.key(text)
+        if self.cache is not None:
+            pcm = self.cache.get(key)
+            if pcm is not None:
+                TTS_CACHE.inc("hit")
+                return pcm
+            TTS_CACHE.inc("miss")
+        return await self._inflight.get_or_render(key, lambda: self._synthesize_and_store(key, text))
+
+    async def _synthesize_and_store(self, key, text):
+        pcm = await self.synthesize_uncached(text)
+        if pcm and self.cache is not None:
+            self.cache.put(key, pcm)
+        return pcm
+
+    async def synthesize_long(self, text):
+        """מקריא טקסט ארוך: חותך לקטעים, יוצר אותם במקביל ומחבר לפי הסדר"""
+        chunks = split_text(text, self.chunk_bytes)
+        if len(chunks) <= 1:
+            return await self.synthesize(text)
+        logging.info(f"✂️ הטקסט חולק ל-{len(chunks)} קטעים להקראה")
+        parts = await asyncio.gather(*(self.synthesize(chunk) for chunk in chunks))
+        if not all(parts):
+            # עדיף לא להעלות מבזק חסר באמצע
+            logging.error("❌ חלק מקטעי ההקראה נכשלו, המבזק לא ייווצר.")
+            return None
+        return b"".join(parts)
+
+    async def synthesize_uncached(self, text):
+        if not text: return None
+        if not self._clients:
+            await self.start()
+            if not self._clients:
+                return None
+        client = next(self._next_client)
+        started = time.perf_counter()
+        try:
+            async with self._fanout:
+                response = await client.synthesize_speech(
+                    input=self._texttospeech.SynthesisInput(text=text),
+                    voice=self.voice,
+                    audio_config=self.audio_config,
+                    retry=self.retry,
+                    timeout=self.timeout,
+                )
+            pcm = wav_to_pcm(response.audio_content)
+            TTS_REQUESTS.inc("ok")
+            TTS_CHARACTERS.inc(amount=len(text))
+            return pcm
+        except Exception as e:
+            self.failures += 1
+            TTS_REQUESTS.inc("error")
+            logging.error(f"שגיאה ביצירת TTS: {e}")
+            return None
+        finally:
+            latency = time.perf_counter() - started
+            self.calls += 1
+            self.total_latency += latency
+            self.last_latency = latency
+            logging.info(f"🎤 TTS: {len(text)} תווים, {latency:.2f} שניות")
@@ -0,0 +1,129 @@
+import hashlib
+import logging
+import os
+from collections import OrderedDict
+
+# ---------------------------------------------------------
+# 🗃️ מטמון שמע TTS (זיכרון + דיסק)
+# ---------------------------------------------------------
+# המפתח נגזר מהטקסט, הקול, מהירות ההקראה והקידוד, כך שאותו טקסט
+# לא נשלח לגוגל פעמיים. שתי השכבות מוגבלות בגודל ומפנות את
+# הפריטים שלא היו בשימוש הכי הרבה זמן (LRU).
+
+
+def cache_key(text, voice, speaking_rate, encoding):
+    raw = "\x1f".join([text, voice, f"{speaking_rate:g}", encoding])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class TTSCache:
+    def __init__(self, directory, max_disk_bytes=200 * 1024 * 1024, max_memory_bytes=32 * 1024 * 1024):
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.max_memory_bytes = max_memory_bytes
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk = OrderedDict()
+        self._disk_bytes = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._load_disk_index()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".pcm")
+
+    def _load_disk_index(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".pcm"):
+                continue
+            try:
+                st = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, name[:-4], st.st_size))
+        # הישנים ביותר בראש הרשימה, הם הראשונים להתפנות
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+        self._evict_disk()
+
+    def get(self, key):
+        data = self._memory.get(key)
+        if data is not None:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return data
+
+        # קובץ שתהליך אחר (עותק נוסף של הבוט) כתב לאותה תיקייה
+        if key not in self._disk and self.directory:
+            try:
+                self._disk[key] = os.path.getsize(self._path(key))
+                self._disk_bytes += self._disk[key]
+            except OSError:
+                pass
+
+        if key in self._disk:
+            try:
+                with open(self._path(key), "rb") as f:
+                    data = f.read()
+                os.utime(self._path(key))
+            except OSError:
+                self._forget_disk(key)
+            else:
+                self._disk.move_to_end(key)
+                self._remember(key, data)
+                self.hits += 1
+                return data
+
+        self.misses += 1
+        return None
+
+    def __contains__(self, key):
+        return key in self._memory or key in self._disk
+
+    def put(self, key, data):
+        if not data:
+            return
+        self._remember(key, data)
+        if not self.directory or key in self._disk:
+            return
+        path = self._path(key)
+        # שם זמני לכל תהליך, כדי ששני עותקים לא יכתבו לאותו קובץ ביניים
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.warning(f"⚠️ לא הצלחתי לשמור שמע במטמון: {e}")
+            return
+        self._disk[key] = len(data)
+        self._disk_bytes += len(data)
+        self._evict_disk()
+
+    def _remember(self, key, data):
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= len(old)
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.max_memory_bytes and len(self._memory) > 1:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def _evict_disk(self):
+        while self._disk_bytes > self.max_disk_bytes and self._disk:
+            key = next(iter(self._disk))
+            self._forget_disk(key)
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def _forget_disk(self, key):
+        size = self._disk.pop(key, None)
+        if size is not None:
+            self._disk_bytes -= size
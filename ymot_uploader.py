@@ -0,0 +1,293 @@
+import asyncio
+import logging
+import os
+import random
+import uuid
+
+import httpx
+
+from channel_queue import ChannelDispatcher
+from job_log import log_stage
+from metrics import UPLOADS
+
+# ---------------------------------------------------------
+# 📤 העלאת קבצים לימות המשיח (call2all UploadFile)
+# ---------------------------------------------------------
+# חיבורים קבועים (keep-alive) לשרת, זמנים קצובים מפורשים, ניסיונות
+# חוזרים עם המתנה מעריכית ורעש אקראי, ותור העלאות ברקע כדי שהעיבוד
+# של ההודעה הבאה לא יחכה לרשת. ההעלאות לכל שלוחה יוצאות לפי הסדר.
+#
+# קבצים גדולים (מעל chunk_threshold) עולים בחלקים בפרוטוקול של call2all:
+# כל חלק נשלח עם qquuid ו-qqpartindex וניסיונות חוזרים משלו, כמה חלקים
+# במקביל, ובסוף בקשת UploadFile?done מרכיבה את הקובץ בשרת. ניתוק באמצע
+# שולח מחדש רק את החלק שנפל, לא את כל הקובץ.
+#
+# העלאה שלמה (ו-done) עם autoNumbering אינה אידמפוטנטית: אם הבקשה הגיעה
+# לשרת, שליחה חוזרת יוצרת קובץ נוסף בשלוחה. לכן:
+# - כשל בהתחברות, 429, 502 ו-503 - הקובץ לא נשמר, ושולחים שוב.
+# - 500, 504 או ניתוק אחרי השליחה - לא ידוע אם נשמר. ממתינים, בודקים ברשימת
+#   הקבצים של השלוחה (GetIVR2Dir) אם נוסף קובץ מאז תחילת ההעלאה, ושולחים
+#   שוב רק אם לא.
+# חלק בודד נשמר לפי qquuid ו-qqpartindex ושליחה חוזרת דורסת אותו, ולכן הוא
+# נשלח שוב על כל כשל.
+
+YMOT_API_URL = os.getenv("YMOT_API_URL", "https://call2all.co.il/ym/api/")
+
+
+class UploadError(Exception):
+    """retryable: בטוח לשלוח שוב. ambiguous: ייתכן שהשרת שמר את הקובץ."""
+
+    def __init__(self, message, retryable=False, ambiguous=False):
+        super().__init__(message)
+        self.retryable = retryable
+        self.ambiguous = ambiguous
+
+
+class YmotUploader:
+    def __init__(self, token, base_url=YMOT_API_URL, max_attempts=4, connect_timeout=10.0,
+                 read_timeout=60.0, max_connections=4, backoff_base=1.0, backoff_max=20.0,
+                 chunk_threshold=4 * 1024 * 1024, chunk_size=1024 * 1024, chunk_parallelism=3,
+                 verify_delay=5.0):
+        self.token = token
+        # המתנה לפני בדיקת השלוחה אחרי כשל לא ודאי, כדי שהשרת יסיים לשמור
+        self.verify_delay = verify_delay
+        self.chunk_threshold = chunk_threshold
+        self.chunk_size = chunk_size
+        self.chunk_parallelism = max(1, chunk_parallelism)
+        self.base_url = base_url.rstrip("/") + "/"
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self._client = None
+        # תור לכל שלוחה, כך שהמספור האוטומטי בימות נשמר לפי סדר ההודעות
+        self._queue = ChannelDispatcher(self._run_queued, max_concurrency=max_connections, name="uploads")
+
+    async def start(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout, limits=self.limits)
+
+    async def close(self):
+        await self._queue.join()
+        await self._queue.shutdown()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def enqueue(self, source, target_path, filename="upload.wav"):
+        """מכניס העלאה לתור הרקע ומחזיר Future עם תשובת השרת"""
+        future = asyncio.get_running_loop().create_future()
+        self._queue.submit(target_path, (source, target_path, filename, future))
+        return future
+
+    async def join(self):
+        await self._queue.join()
+
+    def pending(self):
+        return self._queue.total_pending()
+
+    async def _run_queued(self, job):
+        source, target_path, filename, future = job
+        try:
+            result = await self.upload(source, target_path, filename)
+        except Exception as e:
+            logging.error(f"❌ שגיאה בהעלאה לימות ({target_path}): {e}")
+            if not future.done():
+                future.set_exception(e)
+                # אף אחד לא חייב להמתין לתוצאה; מונע אזהרת "exception never retrieved"
+                future.exception()
+        else:
+            if not future.done():
+                future.set_result(result)
+
+    async def upload(self, source, target_path, filename="upload.wav"):
+        """מעלה קובץ (bytes או נתיב לקובץ) עם ניסיונות חוזרים, ומחזיר את תשובת השרת"""
+        await self.start()
+        data = {'token': self.token, 'path': target_path, 'convertAudio': '1', 'autoNumbering': 'true'}
+        size = _source_size(source)
+        with log_stage("upload", path=target_path, bytes=size):
+            verify = await self._stored_file_check(target_path)
+            if size > self.chunk_threshold:
+                result = await self._upload_chunked(source, data, filename, verify)
+            else:
+                result = await self._with_retries(
+                    lambda: self._post_once(source, data, filename), target_path, verify)
+        UPLOADS.inc("ok")
+        logging.info(f"📞 הועלה ל-{target_path}: {result}")
+        return result
+
+    async def _with_retries(self, call, label, verify=None):
+        """verify: פונקציה שבודקת אחרי כשל לא ודאי אם הקובץ נשמר (ומחזירה
+        תשובה בסגנון ימות), או None אם הבקשה לא אמורה ליצור קובץ."""
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                return await call()
+            except UploadError as e:
+                retryable = e.retryable
+                if e.ambiguous and verify is not None:
+                    UPLOADS.inc("ambiguous_error")
+                    logging.warning(f"⚠️ העלאה ל-{label} נכשלה אחרי השליחה: {e}. בודק אם הקובץ נשמר")
+                    await asyncio.sleep(self.verify_delay)
+                    stored = await verify()
+                    if stored is not None:
+                        logging.info(f"✅ הקובץ נמצא בשלוחה ({stored['path']}), לא שולח שוב")
+                        return stored
+                    retryable = True
+                else:
+                    UPLOADS.inc("retryable_error" if retryable else "error")
+                if not retryable or attempt == self.max_attempts:
+                    raise
+                delay = self._backoff(attempt)
+                logging.warning(f"⚠️ העלאה ל-{label} נכשלה (ניסיון {attempt}): {e}. מנסה שוב בעוד {delay:.1f} שניות")
+                await asyncio.sleep(delay)
+
+    def _backoff(self, attempt):
+        # המתנה מעריכית עם רעש מלא (full jitter)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+
+    async def _post_once(self, source, data, filename):
+        file_obj = None
+        try:
+            if isinstance(source, (bytes, bytearray, memoryview)):
+                payload = bytes(source)
+            else:
+                # קובץ מהדיסק נקרא ונשלח בחלקים, לא נטען כולו לזיכרון
+                file_obj = open(source, "rb")
+                payload = file_obj
+            files = {'file': (filename, payload, 'audio/wav')}
+            response = await self._client.post("UploadFile", data=data, files=files)
+        except httpx.TransportError as e:
+            raise transport_error(e)
+        finally:
+            if file_obj is not None:
+                file_obj.close()
+        return parse_response(response)
+
+    # --- בדיקת השלוחה אחרי כשל לא ודאי ---
+    async def _stored_file_check(self, target_path):
+        """מצלם את רשימת הקבצים בשלוחה ומחזיר פונקציה שמחזירה את הקובץ
+        שנוסף מאז (או None). אם אי אפשר לקרוא את השלוחה מחזיר None, וכשל
+        לא ודאי לא נשלח שוב."""
+        try:
+            before = await self._list_files(target_path)
+        except UploadError as e:
+            logging.warning(f"⚠️ לא ניתן לקרוא את רשימת הקבצים ב-{target_path}: {e}")
+            return None
+
+        async def verify():
+            # קריאת השלוחה בטוחה לחזרה; אם היא נכשלת בכל הניסיונות, השגיאה עולה
+            after = await self._with_retries(lambda: self._list_files(target_path), f"{target_path} (בדיקה)")
+            added = sorted(after - before)
+            if not added:
+                return None
+            return {"responseStatus": "OK", "path": added[-1], "verified": True}
+        return verify
+
+    async def _list_files(self, target_path):
+        params = {'token': self.token, 'path': target_path}
+        try:
+            response = await self._client.get("GetIVR2Dir", params=params)
+        except httpx.TransportError as e:
+            raise transport_error(e, idempotent=True)
+        result = parse_response(response, chunk=True)
+        return {f.get("name") for f in result.get("files") or () if isinstance(f, dict)}
+
+    # --- העלאה בחלקים ---
+    async def _upload_chunked(self, source, data, filename, verify=None):
+        total_size = _source_size(source)
+        total_parts = -(-total_size // self.chunk_size)
+        transfer = {
+            'qquuid': str(uuid.uuid4()),
+            'qqfilename': filename,
+            'qqtotalfilesize': str(total_size),
+            'qqtotalparts': str(total_parts),
+            'uploader': 'yemot-admin',
+        }
+        slots = asyncio.Semaphore(self.chunk_parallelism)
+        target_path = data['path']
+        logging.info(f"📦 מעלה {total_size} בתים ל-{target_path} ב-{total_parts} חלקים")
+
+        async def send_part(index):
+            offset = index * self.chunk_size
+            async with slots:
+                chunk = _read_range(source, offset, self.chunk_size)
+                part = dict(data, **transfer, qqpartindex=str(index),
+                            qqpartbyteoffset=str(offset), qqchunksize=str(len(chunk)))
+                await self._with_retries(
+                    lambda: self._post_part(part, chunk, filename), f"{target_path} (חלק {index + 1}/{total_parts})")
+
+        # לכל חלק עד max_attempts ניסיונות (ב-_with_retries); חלק שנכשל בכולם
+        # מכשיל את ההעלאה, ו-done נשלח רק כשכל החלקים אושרו
+        results = await asyncio.gather(*(send_part(i) for i in range(total_parts)), return_exceptions=True)
+        errors = [r for r in results if isinstance(r, BaseException)]
+        if errors:
+            raise errors[0]
+        final = dict(data, **transfer)
+        return await self._with_retries(lambda: self._post_done(final), target_path, verify)
+
+    async def _post_part(self, fields, chunk, filename):
+        try:
+            response = await self._client.post(
+                "UploadFile", data=fields, files={'qqfile': (filename, chunk, 'application/octet-stream')})
+        except httpx.TransportError as e:
+            raise transport_error(e, idempotent=True)
+        return parse_response(response, chunk=True)
+
+    async def _post_done(self, fields):
+        try:
+            response = await self._client.post("UploadFile?done", data=fields)
+        except httpx.TransportError as e:
+            raise transport_error(e)
+        return parse_response(response)
+
+
+def _source_size(source):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return len(source)
+    return os.path.getsize(source)
+
+
+def _read_range(source, offset, size):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return bytes(memoryview(source)[offset:offset + size])
+    with open(source, "rb") as f:
+        f.seek(offset)
+        return f.read(size)
+
+
+# הבקשה לא יצאה מהלקוח, ולכן בטוח לשלוח אותה שוב גם כשהיא לא אידמפוטנטית
+_NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+def transport_error(error, idempotent=False):
+    if idempotent or isinstance(error, _NOT_SENT_ERRORS):
+        return UploadError(f"שגיאת רשת: {error!r}", retryable=True)
+    # ייתכן שהשרת קיבל ושמר את הקובץ; שליחה חוזרת בלי בדיקה הייתה יוצרת עותק נוסף
+    return UploadError(f"שגיאת רשת אחרי שליחת הבקשה (ייתכן שהקובץ הועלה): {error!r}", ambiguous=True)
+
+
+# שער או שרת לא זמין: הבקשה לא עובדה והקובץ לא נשמר
+_NOT_STORED_STATUSES = (429, 502, 503)
+
+
+def parse_response(response, chunk=False):
+    """בודק את קוד ה-HTTP ואת responseStatus בתשובת ה-JSON של ימות.
+    chunk: תשובה לבקשה אידמפוטנטית (חלק בודד), שמותר לשלוח שוב על כל שגיאת שרת."""
+    if response.status_code in _NOT_STORED_STATUSES:
+        raise UploadError(f"HTTP {response.status_code}", retryable=True)
+    if response.status_code >= 500:
+        raise UploadError(f"HTTP {response.status_code}", retryable=chunk, ambiguous=not chunk)
+    if response.status_code >= 400:
+        raise UploadError(f"HTTP {response.status_code}: {response.text[:200]}")
+    try:
+        result = response.json()
+    except ValueError:
+        raise UploadError(f"תשובה לא תקינה מהשרת: {response.text[:200]}", retryable=chunk, ambiguous=not chunk)
+    if chunk and isinstance(result, dict) and result.get("success") is True:
+        # תשובה לחלק בודד בסגנון fine-uploader
+        return result
+    if not isinstance(result, dict) or result.get("responseStatus") != "OK":
+        message = result.get("message") if isinstance(result, dict) else result
+        raise UploadError(f"ימות דחו את ההעלאה: {message}")
+    return result